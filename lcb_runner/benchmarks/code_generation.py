@@ -10,6 +10,13 @@ from dataclasses import dataclass
 
 from datasets import load_dataset, load_from_disk
 
+from lcb_runner.benchmarks.snapshot import (
+    SnapshotBlob,
+    load_snapshot_index,
+    read_snapshot_rows,
+    write_snapshot,
+)
+
 
 class Platform(Enum):
     LEETCODE = "leetcode"
@@ -71,25 +78,36 @@ class CodeGenerationProblem:
                 self.extra_test = [Test(**t) for t in self.extra_test]
             else:
                 self.extra_test = []
-            try:
-                self.private_test_cases = json.loads(self.private_test_cases)  # type: ignore
-            except:
-                self.private_test_cases = json.loads(
-                    pickle.loads(
-                        zlib.decompress(
-                            base64.b64decode(self.private_test_cases.encode("utf-8"))  # type: ignore
-                        )
-                    )
-                )  # type: ignore
-            self.private_test_cases = [Test(**t) for t in self.private_test_cases]
         else:
             self.public_test_cases = [Test(**{"input": t, "output": "", "testtype": TestType.FUNCTIONAL}) for t in self.public_test_cases]
-            self.private_test_cases = [Test(**{"input": self.private_test_cases + "\n\n" + f"check({self.metadata['func_name']})", "output": "", "testtype": TestType.FUNCTIONAL})]
             if self.extra_test is not None:
                 self.extra_test = [Test(**{"input": t, "output": "", "testtype": TestType.FUNCTIONAL}) for t in self.extra_test]
             else:
                 self.extra_test = []
 
+    def _decode_private_test_cases(self) -> list[Test]:
+        raw = self._private_test_cases_raw
+        if isinstance(raw, SnapshotBlob):
+            raw = raw.read()
+        if self.platform == Platform.HUMANEVAL:
+            return [Test(**{"input": raw + "\n\n" + f"check({self.metadata['func_name']})", "output": "", "testtype": TestType.FUNCTIONAL})]
+        try:
+            private_test_cases = json.loads(raw)  # type: ignore
+        except:
+            private_test_cases = json.loads(
+                pickle.loads(
+                    zlib.decompress(
+                        base64.b64decode(raw.encode("utf-8"))  # type: ignore
+                    )
+                )
+            )  # type: ignore
+        return [Test(**t) for t in private_test_cases]
+
+    def release_private_tests(self):
+        """Drop the decoded private tests; they are decoded again on next access."""
+        if self._private_test_cases_raw is not None:
+            self._private_test_cases = None
+
     def insert_output(self, output_list: list[str], code_list: list[str]) -> dict:
         return {
             "question_title": self.question_title,
@@ -141,6 +159,28 @@ class CodeGenerationProblem:
         }
 
 
+def _get_private_test_cases(self) -> list[Test]:
+    # private tests can be tens of MB per problem and most scenarios never
+    # read them, so they are only decoded on first access
+    if self._private_test_cases is None:
+        self._private_test_cases = self._decode_private_test_cases()
+    return self._private_test_cases
+
+
+def _set_private_test_cases(self, value):
+    if isinstance(value, list):
+        self._private_test_cases_raw = None
+        self._private_test_cases = value
+    else:
+        self._private_test_cases_raw = value
+        self._private_test_cases = None
+
+
+# installed after @dataclass so that the generated __init__ still takes
+# `private_test_cases` and stores it through the setter
+CodeGenerationProblem.private_test_cases = property(_get_private_test_cases, _set_private_test_cases)
+
+
 def dataset_root() -> Path:
     configured = os.environ.get("DATASET_ROOT") or os.environ.get("LCB_DATASET_ROOT")
     if configured:
@@ -160,28 +200,60 @@ def require_dataset_path(path: Path) -> str:
     return str(path)
 
 
-def load_code_generation_dataset(release_version="release_v1", start_date=None, end_date=None) -> list[CodeGenerationProblem]:
-    # dataset = load_dataset("livecodebench/code_generation_lite", split="test", version_tag=release_version, trust_remote_code=True)
+def dataset_source_path(release_version) -> Path:
     root = dataset_root()
     if release_version == "humaneval":
-        dataset = load_dataset(require_dataset_path(root / "humaneval_livecodebenchtype"))["train"]
+        return root / "humaneval_livecodebenchtype"
     elif release_version == "codecontests":
-        dataset = load_from_disk(require_dataset_path(root / "codecontests_livecodebenchtype"))
+        return root / "codecontests_livecodebenchtype"
     elif release_version == "mbpp":
-        dataset = load_dataset(require_dataset_path(root / "mbpp_livecodebenchtype"))["train"]
-    else:
-        dataset = load_dataset(
-            require_dataset_path(root / "livecodebench___code_generation_lite" / f"release_latest-version_tag={release_version}")
-        )["test"]
+        return root / "mbpp_livecodebenchtype"
+    return root / "livecodebench___code_generation_lite" / f"release_latest-version_tag={release_version}"
 
-    dataset = [CodeGenerationProblem(**p) for p in dataset]  # type: ignore
-    if start_date is not None:
-        p_start_date = datetime.strptime(start_date, "%Y-%m-%d")
-        dataset = [e for e in dataset if p_start_date <= e.contest_date]
 
-    if end_date is not None:
-        p_end_date = datetime.strptime(end_date, "%Y-%m-%d")
-        dataset = [e for e in dataset if e.contest_date <= p_end_date]
+def load_raw_dataset(release_version):
+    # dataset = load_dataset("livecodebench/code_generation_lite", split="test", version_tag=release_version, trust_remote_code=True)
+    source_path = require_dataset_path(dataset_source_path(release_version))
+    if release_version == "humaneval":
+        return load_dataset(source_path)["train"]
+    elif release_version == "codecontests":
+        return load_from_disk(source_path)
+    elif release_version == "mbpp":
+        return load_dataset(source_path)["train"]
+    return load_dataset(source_path)["test"]
+
+
+def load_code_generation_dataset(release_version="release_v1", start_date=None, end_date=None, platforms=None) -> list[CodeGenerationProblem]:
+    p_start_date = datetime.strptime(start_date, "%Y-%m-%d") if start_date is not None else None
+    p_end_date = datetime.strptime(end_date, "%Y-%m-%d") if end_date is not None else None
+
+    # the first load of a release writes a snapshot under dataset_root()/snapshots
+    # that later loads read instead of going through `datasets`
+    source_path = dataset_source_path(release_version)
+    snapshot_dir = dataset_root() / "snapshots" / str(release_version)
+    use_snapshot = not os.environ.get("LCB_NO_DATASET_SNAPSHOT")
+    index = load_snapshot_index(snapshot_dir, source_path) if use_snapshot else None
+    raw_dataset = None
+    if index is None:
+        raw_dataset = load_raw_dataset(release_version)
+        if use_snapshot:
+            try:
+                write_snapshot(snapshot_dir, raw_dataset, source_path)
+                index = load_snapshot_index(snapshot_dir, source_path)
+            except OSError as e:
+                print(f"Could not write the dataset snapshot to {snapshot_dir}: {e}")
+
+    if index is not None:
+        rows = read_snapshot_rows(snapshot_dir, index, p_start_date, p_end_date, platforms)
+        dataset = [CodeGenerationProblem(**p) for p in rows]  # type: ignore
+    else:
+        dataset = [CodeGenerationProblem(**p) for p in raw_dataset]  # type: ignore
+        if p_start_date is not None:
+            dataset = [e for e in dataset if p_start_date <= e.contest_date]
+        if p_end_date is not None:
+            dataset = [e for e in dataset if e.contest_date <= p_end_date]
+        if platforms:
+            dataset = [e for e in dataset if e.platform.value in platforms]
 
     print(f"Loaded {len(dataset)} problems")
     return dataset
@@ -195,4 +267,7 @@ def load_code_generation_dataset_not_fast(release_version="release_v1") -> list[
 
 
 if __name__ == "__main__":
-    dataset = load_code_generation_dataset()
+    import sys
+
+    # `python -m lcb_runner.benchmarks.code_generation <release_version>` compiles the snapshot
+    dataset = load_code_generation_dataset(*sys.argv[1:2])
@@ -0,0 +1,141 @@
+"""Preprocessed snapshots of a code generation dataset.
+
+Loading a release through `datasets` re-reads and converts the whole dataset
+on every run. A snapshot is written once per release under
+`dataset_root()/snapshots/<release_version>/`:
+
+- `rows.jsonl`: the raw rows without their private tests, one JSON line each
+- `private.bin`: the (encoded) private tests of every row, back to back
+- `index.json`: one column per filterable field (`question_id`, `platform`,
+  `contest_date`), the row and private blob offsets, and the modification
+  time of the source dataset
+
+Reads filter on the index columns first and only parse the selected rows.
+Private tests are not read at all; each problem gets a `SnapshotBlob` that
+reads its slice of the memory-mapped `private.bin` when the tests are
+decoded.
+"""
+
+import json
+import mmap
+import os
+from datetime import datetime
+from pathlib import Path
+
+SNAPSHOT_VERSION = 1
+
+
+def source_mtime(path: Path) -> float:
+    latest = os.path.getmtime(path)
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            latest = max(latest, os.path.getmtime(os.path.join(dirpath, filename)))
+    return latest
+
+
+class SnapshotBlob:
+    """A lazily read slice of a snapshot's `private.bin`."""
+
+    _mmaps = {}
+
+    def __init__(self, path: str, offset: int, length: int):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def read(self) -> str:
+        if self.length == 0:
+            return ""
+        data = SnapshotBlob._mmaps.get(self.path)
+        if data is None:
+            with open(self.path, "rb") as f:
+                data = SnapshotBlob._mmaps[self.path] = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        return data[self.offset : self.offset + self.length].decode("utf-8")
+
+
+def write_snapshot(snapshot_dir: Path, rows, source_path: Path):
+    """Write `rows` (dicts with the `CodeGenerationProblem` fields) as a snapshot."""
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    index = {
+        "version": SNAPSHOT_VERSION,
+        "source_path": str(source_path),
+        "source_mtime": source_mtime(source_path),
+        "question_id": [],
+        "platform": [],
+        "contest_date": [],
+        "row_offset": [],
+        "row_length": [],
+        "private_offset": [],
+        "private_length": [],
+    }
+    tmp_suffix = f".tmp{os.getpid()}"
+    row_offset, private_offset = 0, 0
+    with open(snapshot_dir / ("rows.jsonl" + tmp_suffix), "wb") as rows_file, open(
+        snapshot_dir / ("private.bin" + tmp_suffix), "wb"
+    ) as private_file:
+        for row in rows:
+            row = dict(row)
+            private = row.pop("private_test_cases").encode("utf-8")
+            line = (json.dumps(row, default=str) + "\n").encode("utf-8")
+            contest_date = row["contest_date"]
+            if not isinstance(contest_date, datetime):
+                contest_date = datetime.fromisoformat(str(contest_date))
+            index["question_id"].append(row["question_id"])
+            index["platform"].append(row["platform"])
+            index["contest_date"].append(contest_date.isoformat())
+            index["row_offset"].append(row_offset)
+            index["row_length"].append(len(line))
+            index["private_offset"].append(private_offset)
+            index["private_length"].append(len(private))
+            rows_file.write(line)
+            private_file.write(private)
+            row_offset += len(line)
+            private_offset += len(private)
+    with open(snapshot_dir / ("index.json" + tmp_suffix), "w") as f:
+        json.dump(index, f)
+    # the index goes last, so a reader never sees it next to half-written data
+    for name in ("rows.jsonl", "private.bin", "index.json"):
+        os.replace(snapshot_dir / (name + tmp_suffix), snapshot_dir / name)
+
+
+def load_snapshot_index(snapshot_dir: Path, source_path: Path):
+    """Return the snapshot index, or None if it is missing or older than the source."""
+    index_path = snapshot_dir / "index.json"
+    if not index_path.exists():
+        return None
+    with open(index_path) as f:
+        index = json.load(f)
+    if index.get("version") != SNAPSHOT_VERSION:
+        return None
+    if source_path.exists() and source_mtime(source_path) > index["source_mtime"]:
+        return None
+    return index
+
+
+def read_snapshot_rows(snapshot_dir: Path, index, start_date=None, end_date=None, platforms=None) -> list[dict]:
+    """Return the raw rows of the snapshot that pass the date and platform filters."""
+    platforms = set(platforms) if platforms else None
+    selected = []
+    for idx, contest_date in enumerate(index["contest_date"]):
+        if platforms is not None and index["platform"][idx] not in platforms:
+            continue
+        if start_date is not None or end_date is not None:
+            contest_date = datetime.fromisoformat(contest_date)
+            if start_date is not None and contest_date < start_date:
+                continue
+            if end_date is not None and contest_date > end_date:
+                continue
+        selected.append(idx)
+    private_path = str(snapshot_dir / "private.bin")
+    rows = []
+    with open(snapshot_dir / "rows.jsonl", "rb") as f:
+        for idx in selected:
+            f.seek(index["row_offset"][idx])
+            row = json.loads(f.read(index["row_length"][idx]))
+            row["private_test_cases"] = SnapshotBlob(
+                private_path, index["private_offset"][idx], index["private_length"][idx]
+            )
+            rows.append(row)
+    return rows
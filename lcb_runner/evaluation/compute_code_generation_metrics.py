@@ -10,47 +10,87 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 import json
 import multiprocessing
 from collections import defaultdict
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 
 import numpy as np
 from tqdm import tqdm
 
-from lcb_runner.evaluation.testing_util import run_test
+from lcb_runner.evaluation.sandbox_pool import (
+    get_sandbox_pool,
+    run_job,
+    wait_for_result,
+)
 from lcb_runner.evaluation.pass_k_utils import compute_metrics_from_results
 
 
-def _temp_run(sample, generation, debug, result, metadata_list, timeout):
-    res, metadata = run_test(sample, test=generation, debug=debug, timeout=timeout)
-    result.append(res)
-    metadata_list.append(metadata)
+def _temp_run(sample, generation, debug, conn, timeout, run_options=None):
+    conn.send(run_job(sample, generation, debug, timeout, run_options))
+    conn.close()
 
 
-def check_correctness(sample, generation, timeout, debug=True):
+def check_correctness(
+    sample,
+    generation,
+    timeout,
+    debug=True,
+    pool=None,
+    num_shards=1,
+    cache=None,
+    run_options=None,
+):
     """Check correctness of code generation with a global timeout.
     The global timeout is to catch some extreme/rare cases not handled by the timeouts
-    inside `run_test`"""
+    inside `run_test`.
+    If `pool` (a `SandboxPool`) is given the candidate runs in one of its
+    long-lived workers instead of a freshly started process, and with
+    `num_shards > 1` its tests are split across that many workers, stopping at
+    the first failure.
+    If `cache` (an `EvalResultCache`) is given, a candidate already graded on
+    the same tests is not executed again.
+    `run_options` are extra keyword arguments for `run_test`, such as
+    `stdio_engine`."""
+
+    if cache is not None:
+        cached = cache.get(sample, generation, timeout, run_options)
+        if cached is not None:
+            return cached
+    result = _check_correctness(
+        sample, generation, timeout, debug, pool, num_shards, run_options
+    )
+    if cache is not None:
+        cache.put(sample, generation, timeout, result, run_options)
+    return result
+
+
+def _check_correctness(sample, generation, timeout, debug, pool, num_shards, run_options):
+    if pool is not None:
+        if num_shards > 1:
+            return pool.run_sharded(
+                sample, generation, timeout, num_shards, debug=debug, run_options=run_options
+            )
+        return pool.run(sample, generation, timeout, debug=debug, run_options=run_options)
 
-    manager = multiprocessing.Manager()
-    result = manager.list()
-    metadata_list = manager.list()
+    # one-shot pipe instead of Manager list proxies: no Manager server process
+    # per candidate and a single message instead of an IPC round trip per append
+    recv_conn, send_conn = multiprocessing.Pipe(duplex=False)
     p = multiprocessing.Process(
         target=_temp_run,
-        args=(sample, generation, debug, result, metadata_list, timeout),
+        args=(sample, generation, debug, send_conn, timeout, run_options),
     )
     p.start()
-    p.join(
-        timeout=(timeout + 1) * len(json.loads(sample["input_output"])["inputs"]) + 5
-    )
-    if p.is_alive():
-        p.kill()
-    if not result:
-        in_outs = json.loads(sample["input_output"])
-        # consider that all tests failed
-        result = [[-1 for i in range(len(in_outs["inputs"]))]]
-        if debug:
-            print(f"global timeout")
-    return result[0], metadata_list[0]
+    # drop the parent's copy of the write end so a dead child reads as EOF
+    send_conn.close()
+    try:
+        result, _ = wait_for_result(
+            recv_conn, p, sample, timeout, debug, run_options=run_options
+        )
+    finally:
+        if p.is_alive():
+            p.kill()
+        p.join()
+        recv_conn.close()
+    return result
 
 
 def evaluate_generations_by_problem(args):
@@ -58,6 +98,10 @@ def evaluate_generations_by_problem(args):
     sample = args[1]
     debug: bool = args[2]
     timeout: int = args[3]
+    pool = args[4] if len(args) > 4 else None
+    num_shards: int = args[5] if len(args) > 5 else 1
+    cache = args[6] if len(args) > 6 else None
+    run_options = args[7] if len(args) > 7 else None
 
     res = []
     metadata = []
@@ -65,7 +109,14 @@ def evaluate_generations_by_problem(args):
         curr_res = [-2]
         try:
             curr_res, curr_metadata = check_correctness(
-                sample, o, timeout=timeout, debug=debug
+                sample,
+                o,
+                timeout=timeout,
+                debug=debug,
+                pool=pool,
+                num_shards=num_shards,
+                cache=cache,
+                run_options=run_options,
             )
             if debug:
                 print(f"\nSuccessful compilation of task {o_idx}!")
@@ -111,6 +162,11 @@ def evaluate_generations(
     debug: bool = False,
     num_process_evaluate: int = 16,
     timeout=6,
+    use_sandbox_pool: bool = True,
+    sandbox_max_jobs: int = 100,
+    test_shards: int = 1,
+    eval_cache=None,
+    run_options=None,
 ):
     """We take the list of code generations and try to compile them
      and the run their corresponding unit tests which are retrieved from the APPS dataset.
@@ -118,6 +174,11 @@ def evaluate_generations(
     Args:
         generations: list of code generations (same order as samples in APPS dataset)
         level: difficulty level used in the generation, can be "all", "introductory", "interview" or "competition"
+        use_sandbox_pool: run candidates in long-lived sandbox workers instead of one process per candidate
+        sandbox_max_jobs: recycle a sandbox worker after this many candidates (0 means never)
+        test_shards: split each problem's tests across this many sandbox workers, stopping at the first failure
+        eval_cache: optional `EvalResultCache` used to skip candidates that were already graded
+        run_options: extra keyword arguments for `run_test`, such as `stdio_engine`
 
     Returns:
         results: dictionary of results, key is the problem index, value is a list of results for each generation
@@ -125,15 +186,35 @@ def evaluate_generations(
 
     # generations are code generations in the same order of the dataset
 
+    max_workers = 1 if debug else num_process_evaluate
+    if use_sandbox_pool:
+        # the sandbox workers do the execution, so plain threads are enough
+        # to keep them busy
+        pool = get_sandbox_pool(max_workers, sandbox_max_jobs)
+        executor_cls = ThreadPoolExecutor
+    else:
+        pool = None
+        executor_cls = ProcessPoolExecutor
+
     inputs = [
-        [(generations_list[index], samples_list[index], debug, timeout), index]
+        [
+            (
+                generations_list[index],
+                samples_list[index],
+                debug,
+                timeout,
+                pool,
+                test_shards,
+                eval_cache,
+                run_options,
+            ),
+            index,
+        ]
         for index in range(len(generations_list))
     ]
     # import ipdb; ipdb.set_trace()
     with tqdm(total=len(inputs)) as pbar:
-        with ProcessPoolExecutor(
-            max_workers=1 if debug else num_process_evaluate
-        ) as executor:
+        with executor_cls(max_workers=max_workers) as executor:
             futures = {
                 executor.submit(evaluate_generations_by_problem, arg): index
                 for arg, index in inputs
@@ -161,6 +242,11 @@ def codegen_metrics(
     num_process_evaluate=16,
     timeout=6,
     debug=False,
+    use_sandbox_pool=True,
+    sandbox_max_jobs=100,
+    test_shards=1,
+    eval_cache=None,
+    run_options=None,
 ):
 
     samples_linear = []
@@ -186,6 +272,11 @@ def codegen_metrics(
         debug=debug,
         num_process_evaluate=num_process_evaluate,
         timeout=timeout,
+        use_sandbox_pool=use_sandbox_pool,
+        sandbox_max_jobs=sandbox_max_jobs,
+        test_shards=test_shards,
+        eval_cache=eval_cache,
+        run_options=run_options,
     )
 
     for idx, sub_results in sorted(results_linear.items(), key=lambda x: x[0]):
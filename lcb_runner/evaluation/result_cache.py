@@ -0,0 +1,161 @@
+"""On-disk cache of `run_test` results.
+
+Identical candidates are graded again and again: `codegen_metrics` re-runs
+unchanged `code_list` entries on every `--evaluate`, and checkerextend re-runs
+the public tests of the same code in several stages. `EvalResultCache` stores
+`(result, metadata)` in SQLite, keyed by the hash of the normalized code, the
+hash of the `input_output` test suite, the timeout, the non-default `run_test`
+options and `EVALUATOR_VERSION`.
+The file is kept under `max_bytes` by evicting the least recently used rows.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# bump whenever a change to the grading logic can change a verdict, so stale
+# cached verdicts are not reused
+EVALUATOR_VERSION = "2"
+
+
+def normalize_code(code: str) -> str:
+    lines = str(code).replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def _json_default(value):
+    # numpy scalars (np.bool_, np.int64, ...) show up in run_test results
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+def is_cacheable(result) -> bool:
+    _, metadata = result
+    # timeouts and killed sandboxes depend on machine load, so they are always re-run
+    if metadata.get("error_code") == -3:
+        return False
+    return not str(metadata.get("error", "")).startswith("sandbox worker exited")
+
+
+class EvalResultCache:
+    def __init__(self, path: str, max_bytes: int = 2 * 1024**3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._io_hashes = {}
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_access REAL)"
+        )
+        self._connect().execute(
+            "CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)"
+        )
+
+    def __getstate__(self):
+        # sqlite connections cannot cross processes; reopen lazily on the other side
+        return {"path": self.path, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["max_bytes"])
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _input_output_hash(self, input_output: str) -> str:
+        # the same (often multi-MB) test suite is shared by every candidate of
+        # a problem, so remember its digest by identity
+        with self._lock:
+            entry = self._io_hashes.get(id(input_output))
+            if entry is not None and entry[0] is input_output:
+                return entry[1]
+        digest = hashlib.sha256(input_output.encode("utf-8")).hexdigest()
+        with self._lock:
+            if len(self._io_hashes) >= 256:
+                self._io_hashes.clear()
+            self._io_hashes[id(input_output)] = (input_output, digest)
+        return digest
+
+    def key(self, sample, code, timeout, run_options=None) -> str:
+        code_hash = hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+        io_hash = self._input_output_hash(sample["input_output"])
+        key = f"{EVALUATOR_VERSION}:{timeout}:{io_hash}:{code_hash}"
+        if run_options:
+            key += ":" + json.dumps(run_options, sort_keys=True)
+        return key
+
+    def get(self, sample, code, timeout, run_options=None):
+        key = self.key(sample, code, timeout, run_options)
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key)
+        )
+        result, metadata = json.loads(row[0])
+        return result, metadata
+
+    def put(self, sample, code, timeout, result, run_options=None):
+        if not is_cacheable(result):
+            return
+        key = self.key(sample, code, timeout, run_options)
+        value = json.dumps(list(result), default=_json_default)
+        self._connect().execute(
+            "INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, value, len(value), time.time()),
+        )
+        with self._lock:
+            self._puts_since_evict += 1
+            if self._puts_since_evict < 100:
+                return
+            self._puts_since_evict = 0
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used rows until the cache is below 90% of `max_bytes`."""
+        if not self.max_bytes:
+            return
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        target = self.max_bytes * 0.9
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM results ORDER BY last_access ASC")
+        stale = []
+        for key, size in rows:
+            if total <= target:
+                break
+            stale.append((key,))
+            total -= size
+        rows.close()
+        conn.executemany("DELETE FROM results WHERE key = ?", stale)
+
+
+_eval_caches = {}
+_eval_caches_lock = threading.Lock()
+
+
+def open_eval_cache(path: str, max_bytes: int = 2 * 1024**3) -> EvalResultCache:
+    """Return the process-wide cache for `path`, opening it on first use."""
+    with _eval_caches_lock:
+        cache = _eval_caches.get(path)
+        if cache is None:
+            cache = _eval_caches[path] = EvalResultCache(path, max_bytes)
+        cache.max_bytes = max_bytes
+        return cache
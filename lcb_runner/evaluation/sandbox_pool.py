@@ -0,0 +1,420 @@
+"""Long-lived sandbox workers for `run_test`.
+
+`check_correctness` used to start a `multiprocessing.Manager` server and a
+fresh `Process` for every candidate. A `SandboxPool` instead keeps a fixed
+number of pre-forked workers alive. Each worker builds the namespace of the
+`testing_util.import_string` prelude once and then serves `run_test` jobs sent
+over a pipe. The worker never runs a candidate itself: every job runs in a
+child forked from it, so process-wide changes a candidate makes (`gc.disable()`,
+patched modules, signal handlers, rlimits) die with that child, while the
+prelude and the caches stay warm in the worker. A worker is replaced after it
+hits the global timeout, or after it has served `max_jobs_per_worker` jobs.
+
+Workers are forked by a forkserver, not by the caller: replacements are
+started while the caller runs thread pools, event loops and HTTP clients, and
+a child forked from a threaded process can inherit locks held by other threads.
+"""
+
+import atexit
+import json
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+
+from lcb_runner.evaluation.test_case_store import TestCaseStore
+from lcb_runner.evaluation.testing_util import (
+    prelude_namespace,
+    run_test,
+    test_time_limits,
+    warm_caches,
+)
+
+
+def sample_num_tests(sample):
+    if "test_range" in sample:
+        start, end = sample["test_range"]
+        return end - start
+    return len(json.loads(sample["input_output"])["inputs"])
+
+
+def global_timeout_budget(sample, timeout, run_options=None):
+    """Wall-clock budget for a whole `run_test` call on `sample`."""
+    run_options = run_options or {}
+    _, wall_limit = test_time_limits(
+        timeout,
+        run_options.get("cpu_timeout"),
+        run_options.get("stdio_engine", "patch"),
+    )
+    return (wall_limit + 1) * sample_num_tests(sample) + 5
+
+
+def global_timeout_result(sample, debug=False):
+    if debug:
+        print(f"global timeout")
+    # consider that all tests failed
+    return [-1 for _ in range(sample_num_tests(sample))], {
+        "error": "global timeout",
+        "error_code": -3,
+        "error_message": "Time Limit Exceeded",
+    }
+
+
+def job_crash_result(sample, exitcode, debug=False):
+    if debug:
+        print(f"sandbox job exited with code {exitcode}")
+    return [-1 for _ in range(sample_num_tests(sample))], {
+        "error": f"sandbox job exited with code {exitcode}",
+        "error_code": -4,
+        "error_message": "Runtime Error",
+    }
+
+
+def worker_crash_result(sample, exitcode, debug=False):
+    if debug:
+        print(f"sandbox worker exited with code {exitcode}")
+    return [-1 for _ in range(sample_num_tests(sample))], {
+        "error": f"sandbox worker exited with code {exitcode}",
+        "error_code": -4,
+        "error_message": "Runtime Error",
+    }
+
+
+def wait_for_result(
+    conn, process, sample, timeout, debug=False, cancel=None, run_options=None
+):
+    """Wait for the reply to one `run_test` job on `conn`.
+
+    Returns `(result, healthy)`. When `process` hits the global timeout or dies
+    before replying, `result` counts every test as failed and `healthy` is
+    False; the caller is then responsible for killing `process`. If the
+    `cancel` event is set while waiting, `(None, False)` is returned.
+    """
+    budget = global_timeout_budget(sample, timeout, run_options)
+    try:
+        if cancel is None:
+            ready = conn.poll(budget)
+        else:
+            deadline = time.monotonic() + budget
+            ready = False
+            while not ready and not cancel.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                ready = conn.poll(min(remaining, 0.05))
+            if not ready and cancel.is_set():
+                return None, False
+        if not ready:
+            return global_timeout_result(sample, debug), False
+        status, payload = conn.recv()
+    except (EOFError, OSError):
+        process.join(timeout=1)
+        return worker_crash_result(sample, process.exitcode, debug), False
+    if status == "error":
+        raise RuntimeError(f"sandbox raised {payload}")
+    if status == "crashed":
+        # the job's child died before replying; the worker itself is fine
+        return job_crash_result(sample, payload, debug), True
+    return payload, True
+
+
+def sandbox_context():
+    """A forkserver context when the platform has one, else the default context.
+
+    The server imports `__main__` and `testing_util` once; every worker is
+    forked from that single-threaded process.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["__main__", "lcb_runner.evaluation.testing_util"])
+    return context
+
+
+def run_job(sample, generation, debug, timeout, run_options=None):
+    try:
+        return (
+            "ok",
+            run_test(
+                sample,
+                test=generation,
+                debug=debug,
+                timeout=timeout,
+                **(run_options or {}),
+            ),
+        )
+    except BaseException as e:
+        return ("error", repr(e))
+
+
+def run_forked_job(job):
+    """Run `run_job(*job)` in a child forked from this process.
+
+    Returns the job's reply, or `("crashed", exitcode)` when the child dies
+    without one (e.g. a candidate calling `os._exit`).
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            data = pickle.dumps(run_job(*job))
+        except BaseException as e:
+            data = pickle.dumps(("error", f"could not send sandbox result: {e!r}"))
+        try:
+            with os.fdopen(write_fd, "wb") as f:
+                f.write(data)
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "rb") as f:
+        data = f.read()
+    _, status = os.waitpid(pid, 0)
+    if not data:
+        return ("crashed", os.waitstatus_to_exitcode(status))
+    return pickle.loads(data)
+
+
+def _sandbox_worker_main(conn):
+    # the worker and its job children form one process group, so killing the
+    # group on a global timeout also ends the job (see `_SandboxWorker.stop`)
+    os.setpgrp()
+    # pay for the prelude imports once per worker instead of once per candidate
+    prelude_namespace()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        # compile the candidate and load its tests here, so the caches
+        # outlive the job's child
+        sample, generation, _, _, run_options = job
+        warm_caches(sample, generation, (run_options or {}).get("stdio_engine", "patch"))
+        reply = run_forked_job(job)
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            break
+        except Exception as e:
+            conn.send(("error", f"could not send sandbox result: {e!r}"))
+
+
+class _SandboxWorker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_sandbox_worker_main, args=(child_conn,), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self, kill=False):
+        if not kill and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (EOFError, OSError):
+                pass
+            self.process.join(timeout=1)
+        if self.process.is_alive():
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    def __init__(self, num_workers, max_jobs_per_worker=100, context=None):
+        self.num_workers = max(1, int(num_workers))
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.context = context or sandbox_context()
+        self._cond = threading.Condition()
+        self._idle = []
+        self._num_started = 0
+        self._closed = False
+        # large test suites are handed to workers as a path instead of
+        # being pickled into every job
+        self.test_store = TestCaseStore()
+        # start everything up front, so the first jobs do not wait for workers
+        for _ in range(self.num_workers):
+            self._idle.append(_SandboxWorker(self.context))
+            self._num_started += 1
+
+    def resize(self, num_workers):
+        with self._cond:
+            self.num_workers = max(self.num_workers, int(num_workers))
+            self._cond.notify_all()
+
+    def _acquire(self, cancel=None):
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("SandboxPool is closed")
+                if cancel is not None and cancel.is_set():
+                    return None
+                if self._idle:
+                    return self._idle.pop()
+                if self._num_started < self.num_workers:
+                    self._num_started += 1
+                    break
+                self._cond.wait(None if cancel is None else 0.05)
+        try:
+            return _SandboxWorker(self.context)
+        except BaseException:
+            with self._cond:
+                self._num_started -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, worker, reusable):
+        if (
+            reusable
+            and self.max_jobs_per_worker
+            and worker.jobs >= self.max_jobs_per_worker
+        ):
+            reusable = False
+        with self._cond:
+            if reusable and not self._closed:
+                self._idle.append(worker)
+                worker = None
+            else:
+                self._num_started -= 1
+            self._cond.notify()
+        if worker is not None:
+            worker.stop(kill=not reusable)
+
+    def run(self, sample, generation, timeout, debug=False, run_options=None):
+        """Run `run_test(sample, generation)` in a sandbox worker.
+
+        `run_options` are extra keyword arguments for `run_test`.
+        Returns `(result, metadata)` with the same contract as `run_test`;
+        a global timeout or a dead worker is reported as all tests failed.
+        """
+        result, _ = self._run(sample, generation, timeout, debug, run_options=run_options)
+        return result
+
+    def _run(self, sample, generation, timeout, debug=False, cancel=None, run_options=None):
+        worker = self._acquire(cancel)
+        if worker is None:
+            return None, False
+        healthy = False
+        try:
+            try:
+                worker.conn.send(
+                    (self.test_store.handle(sample), generation, debug, timeout, run_options)
+                )
+            except (EOFError, OSError):
+                worker.process.join(timeout=1)
+                return worker_crash_result(sample, worker.process.exitcode, debug), False
+            worker.jobs += 1
+            result, healthy = wait_for_result(
+                worker.conn, worker.process, sample, timeout, debug, cancel, run_options
+            )
+        finally:
+            self._release(worker, healthy)
+        return result, healthy
+
+    def run_sharded(
+        self, sample, generation, timeout, num_shards, debug=False, run_options=None
+    ):
+        """Like `run`, but split the tests into up to `num_shards` contiguous
+        shards that run in parallel workers.
+
+        As soon as a shard fails, every later shard is cancelled. The returned
+        results and metadata are the ones a serial `run` would produce: the
+        results up to and including the first failing test, and that test's
+        metadata.
+        """
+        in_outs = json.loads(sample["input_output"])
+        num_tests = len(in_outs["inputs"])
+        num_shards = min(int(num_shards), num_tests)
+        # humaneval appends every test to the program itself, so it cannot be split
+        if num_shards <= 1 or in_outs.get("platform") == "humaneval":
+            return self.run(
+                sample, generation, timeout, debug=debug, run_options=run_options
+            )
+
+        bounds = [num_tests * i // num_shards for i in range(num_shards + 1)]
+        # every shard shares the sample's tests and selects its own range, so
+        # large tests are stored once per problem rather than once per shard
+        shards = [
+            {"input_output": sample["input_output"], "test_range": (start, end)}
+            for start, end in zip(bounds, bounds[1:])
+        ]
+        replies = [None for _ in shards]
+        cancels = [threading.Event() for _ in shards]
+        lock = threading.Lock()
+
+        def run_shard(idx):
+            try:
+                reply = self._run(
+                    shards[idx], generation, timeout, debug, cancels[idx], run_options
+                )
+            except Exception as e:
+                reply = (e, False)
+            result, _ = reply
+            with lock:
+                replies[idx] = reply
+                if result is not None and (
+                    isinstance(result, Exception) or "error_code" in result[1]
+                ):
+                    for cancel in cancels[idx + 1 :]:
+                        cancel.set()
+
+        threads = [
+            threading.Thread(target=run_shard, args=(idx,), daemon=True)
+            for idx in range(len(shards))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        all_results = []
+        total_execution = 0
+        for result, healthy in replies:
+            if isinstance(result, Exception):
+                raise result
+            curr_res, metadata = result
+            if "error_code" not in metadata:
+                all_results += curr_res
+                total_execution += metadata.get("execution time", 0)
+                continue
+            if not healthy:
+                # a global timeout or crash fails the whole sample, as in `run`
+                return [-1 for _ in range(num_tests)], metadata
+            return all_results + list(curr_res), metadata
+        return all_results, {"execution time": total_execution}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._num_started -= len(idle)
+            self._cond.notify_all()
+        for worker in idle:
+            worker.stop()
+        self.test_store.close()
+
+
+_sandbox_pool = None
+_sandbox_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool(num_workers, max_jobs_per_worker=100):
+    """Return the process-wide sandbox pool, creating or growing it as needed."""
+    global _sandbox_pool
+    with _sandbox_pool_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = SandboxPool(num_workers, max_jobs_per_worker)
+            atexit.register(_sandbox_pool.close)
+        else:
+            _sandbox_pool.resize(num_workers)
+            _sandbox_pool.max_jobs_per_worker = max_jobs_per_worker
+        return _sandbox_pool
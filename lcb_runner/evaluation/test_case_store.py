@@ -0,0 +1,104 @@
+"""Shared read-only files for large test suites.
+
+A sample's `input_output` JSON holds every input and output of a problem and
+is pickled into the pipe of every sandbox job, once per candidate. For
+problems with multi-MB inputs, `TestCaseStore.handle` instead writes the
+JSON once to a content-addressed file (under /dev/shm when available) and
+returns a small `{"input_output_path": ...}` sample. The sandbox worker maps
+the file and parses it once per problem, see `testing_util.load_input_output`.
+Shards of a sample carry a "test_range" into the same file.
+
+/dev/shm is memory, so the directory is capped at `max_bytes`: the least
+recently handed out files are unlinked first, but never one handed out in
+the last `min_idle_seconds`, as a job may still be about to open it.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def _default_directory() -> str:
+    base = "/dev/shm" if os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+    return tempfile.mkdtemp(prefix="lcb_tests_", dir=base)
+
+
+class TestCaseStore:
+    def __init__(
+        self,
+        directory: str | None = None,
+        min_bytes: int = 64 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        min_idle_seconds: float = 300.0,
+    ):
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.min_idle_seconds = min_idle_seconds
+        self.directory = directory or _default_directory()
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._paths = {}
+        # path -> [size, last handed out], least recently handed out first
+        self._files = OrderedDict()
+        self._total_bytes = 0
+
+    def handle(self, sample: dict) -> dict:
+        """Return `sample`, or a path handle to its tests when they are large."""
+        input_output = sample.get("input_output")
+        if input_output is None or len(input_output) < self.min_bytes:
+            return sample
+        path = self._path_of(input_output)
+        if "test_range" in sample:
+            return {"input_output_path": path, "test_range": sample["test_range"]}
+        return {"input_output_path": path}
+
+    def _path_of(self, input_output: str) -> str:
+        # every candidate of a problem shares the same string object
+        with self._lock:
+            entry = self._paths.get(id(input_output))
+            if entry is not None and entry[0] is input_output and entry[1] in self._files:
+                self._touch(entry[1])
+                return entry[1]
+        data = input_output.encode("utf-8")
+        path = os.path.join(self.directory, hashlib.sha256(data).hexdigest() + ".json")
+        with self._lock:
+            stored = path in self._files
+        if not stored:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            if path not in self._files:
+                self._files[path] = [len(data), 0.0]
+                self._total_bytes += len(data)
+            self._touch(path)
+            self._evict()
+            if len(self._paths) >= 256:
+                self._paths.clear()
+            self._paths[id(input_output)] = (input_output, path)
+        return path
+
+    def _touch(self, path: str):
+        self._files[path][1] = time.monotonic()
+        self._files.move_to_end(path)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._total_bytes > self.max_bytes and len(self._files) > 1:
+            path, (size, last_used) = next(iter(self._files.items()))
+            if now - last_used < self.min_idle_seconds:
+                break
+            del self._files[path]
+            self._total_bytes -= size
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -1,6 +1,12 @@
 import ast
+import hashlib
 import json
+import mmap
+import os
+import pickle
+import select
 import sys
+import tempfile
 import faulthandler
 import platform
 
@@ -53,6 +59,36 @@ def timeout_handler(signum, frame):
     raise TimeoutException
 
 
+def test_time_limits(timeout, cpu_timeout=None, stdio_engine="patch"):
+    """Return `(cpu_limit, wall_limit)` in seconds for a single test.
+
+    Without a CPU limit (`cpu_limit` None) a test gets `timeout` seconds of
+    wall-clock time, as it always has. With `cpu_timeout`, or in the fork
+    stdio engine, a test is limited on the CPU time it uses, so a loaded
+    machine does not turn correct solutions into timeouts; the wall-clock
+    limit is then only a backstop for programs that sleep or block.
+    """
+    if cpu_timeout is None and stdio_engine != "fork":
+        return None, timeout
+    cpu_limit = timeout if cpu_timeout is None else cpu_timeout
+    return cpu_limit, max(timeout, 2 * cpu_limit + 1)
+
+
+def arm_time_limit(cpu_limit, wall_limit):
+    if cpu_limit is None:
+        signal.alarm(wall_limit)
+        return
+    # ITIMER_PROF counts the user and system CPU time of this process
+    signal.setitimer(signal.ITIMER_PROF, cpu_limit)
+    signal.setitimer(signal.ITIMER_REAL, wall_limit)
+
+
+def disarm_time_limit(cpu_limit):
+    signal.alarm(0)
+    if cpu_limit is not None:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+
+
 # used to capture stdout as a list
 # from https://stackoverflow.com/a/16571630/6416660
 # alternative use redirect_stdout() from contextlib
@@ -153,11 +189,58 @@ def get_function(compiled_sol, fn_name: str):  # type: ignore
         return
 
 
+# the `import_string` namespace, built once per sandbox worker
+_prelude_namespace = None
+# compiled candidates by source hash, kept per sandbox worker since the same
+# candidate is graded on public, generated and private tests in turn; jobs run
+# in forked children, so the worker fills it first (see `warm_caches`)
+_compiled_programs = {}
+
+
+def prelude_namespace() -> dict:
+    global _prelude_namespace
+    if _prelude_namespace is None:
+        namespace = {}
+        exec(import_string, namespace)
+        _prelude_namespace = namespace
+    return _prelude_namespace
+
+
+def compile_program(code: str, filename: str = "<string>"):
+    """Return `(code_object, uses_prelude)` for `code`, compiling it once.
+
+    When `code` starts with `import_string` only the rest is compiled, padded
+    so line numbers are unchanged; run it in a copy of `prelude_namespace()`.
+    """
+    key = (hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest(), filename)
+    entry = _compiled_programs.get(key)
+    if entry is None:
+        uses_prelude = code.startswith(import_string)
+        if uses_prelude:
+            source = "\n" * import_string.count("\n") + code[len(import_string) :]
+        else:
+            source = code
+        entry = (compile(source, filename, "exec"), uses_prelude)
+        if len(_compiled_programs) >= 256:
+            _compiled_programs.clear()
+        _compiled_programs[key] = entry
+    return entry
+
+
+def fresh_namespace(uses_prelude: bool, namespace: dict) -> dict:
+    if uses_prelude:
+        # what running `import_string` would have left behind
+        sys.setrecursionlimit(50000)
+        namespace.update(prelude_namespace())
+    return namespace
+
+
 def compile_code(code: str, timeout: int):
     signal.alarm(timeout)
     try:
         tmp_sol = ModuleType("tmp_sol", "")
-        exec(code, tmp_sol.__dict__)
+        program, uses_prelude = compile_program(code)
+        exec(program, fresh_namespace(uses_prelude, tmp_sol.__dict__))
         if "class Solution" in code:
             # leetcode wraps solutions in `Solution`
             # this is a hack to check if it is leetcode solution or not
@@ -187,6 +270,54 @@ def line_has_decimal_token(line: str) -> bool:
     return any(("." in elem or "e" in elem.lower()) for elem in line.split())
 
 
+def convert_token(token: str):
+    # integers compare exactly with each other and with `Decimal`, so only
+    # tokens that are not integers need the slower `Decimal` parse
+    if "." in token or "e" in token or "E" in token:
+        return Decimal(token)
+    try:
+        return int(token)
+    except ValueError:
+        return Decimal(token)
+
+
+def stdio_lines_match(prediction_line: str, expected_line: str) -> bool:
+    """Compare two stripped output lines that are not exactly equal.
+
+    Same verdict as converting both lines with `convert_line_to_decimals`:
+    the token lists must be numerically equal, or, if either line has a
+    decimal token, close according to `decimal_lines_close`.
+    """
+    ## CASE 2: element-wise comparision
+    ## if there are floating elements
+    ## use `decimal` library for good floating point comparision
+    ## otherwise gotcha: np.isclose(50000000000000000, 50000000000000001) = True
+    ## note that we should always be able to convert to decimals
+    prediction_tokens = prediction_line.split()
+    expected_tokens = expected_line.split()
+    if len(prediction_tokens) != len(expected_tokens):
+        return False
+    try:
+        prediction_values = [convert_token(elem) for elem in prediction_tokens]
+        if prediction_tokens == expected_tokens:
+            # only the spacing differs: the tokens match unless one is NaN,
+            # which never equals itself
+            if all(isinstance(value, int) or value.is_finite() for value in prediction_values):
+                return True
+        expected_values = [convert_token(elem) for elem in expected_tokens]
+    except:
+        return False
+    if prediction_values == expected_values:
+        return True
+    if not (
+        line_has_decimal_token(prediction_line)
+        or line_has_decimal_token(expected_line)
+    ):
+        return False
+    # `int` values mix exactly with `Decimal` arithmetic
+    return decimal_lines_close(prediction_values, expected_values)
+
+
 def decimal_lines_close(
     prediction: list[Decimal],
     expected: list[Decimal],
@@ -239,6 +370,86 @@ def missing_grade_result_metadata(kind: CODE_TYPE, method_name: str | None = Non
     }
 
 
+def memory_limit_metadata(error, gt_inp=None, gt_out=None):
+    metadata = {
+        "error": error if isinstance(error, str) else repr(error),
+        "error_code": -6,
+        "error_message": "Memory Limit Exceeded",
+    }
+    if gt_inp is not None:
+        metadata["inputs"] = truncatefn(gt_inp)
+        metadata["expected"] = truncatefn(gt_out)
+    return metadata
+
+
+def mapped_memory() -> dict:
+    """Current address space ("VmSize") and data segment ("VmData") in bytes."""
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in ("VmSize", "VmData"):
+                    usage[field] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        pass
+    return usage
+
+
+def set_memory_limit(headroom_bytes):
+    """Lower the soft address-space and data limits of this process to
+    `headroom_bytes` above what it maps already.
+
+    A sandbox worker is forked from a parent that may map gigabytes (torch,
+    CUDA, arrow); only what the candidate allocates on top of that counts.
+    Only the soft limits change, so a sandbox worker can lift them again for
+    its next job. Returns the previous limits for `restore_memory_limit`.
+    """
+    import resource
+
+    usage = mapped_memory()
+    previous = {}
+    for limit, field in ((resource.RLIMIT_AS, "VmSize"), (resource.RLIMIT_DATA, "VmData")):
+        soft, hard = resource.getrlimit(limit)
+        previous[limit] = (soft, hard)
+        maximum_memory_bytes = usage.get(field, 0) + headroom_bytes
+        if hard != resource.RLIM_INFINITY:
+            maximum_memory_bytes = min(maximum_memory_bytes, hard)
+        resource.setrlimit(limit, (maximum_memory_bytes, hard))
+    return previous
+
+
+def restore_memory_limit(previous):
+    import resource
+
+    for limit, limits in previous.items():
+        resource.setrlimit(limit, limits)
+
+
+def reset_peak_memory() -> bool:
+    # Linux resets VmHWM (the peak RSS) on writing "5" to clear_refs
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory() -> float:
+    """Peak RSS of this process in MiB, since the last `reset_peak_memory`."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
 def get_stripped_lines(val: str):
     ## you don't want empty lines to add empty list after splitlines!
     val = val.strip()
@@ -246,17 +457,65 @@ def get_stripped_lines(val: str):
     return [val_line.strip() for val_line in val.split("\n")]
 
 
+# parsed call-based tests, pickled, kept per sandbox worker so the candidates
+# of one problem skip the per-line `json.loads`
+_parsed_call_based_tests = {}
+
+
+def parse_call_based_tests(all_inputs: list, all_outputs: list, tests_key=None):
+    blob = _parsed_call_based_tests.get(tests_key) if tests_key is not None else None
+    if blob is not None:
+        # solutions may mutate their list arguments, so every candidate
+        # gets a fresh copy
+        return pickle.loads(blob)
+    parsed = (
+        [[json.loads(line) for line in inputs.split("\n")] for inputs in all_inputs],
+        [json.loads(output) for output in all_outputs],
+    )
+    if tests_key is not None:
+        if len(_parsed_call_based_tests) >= 8:
+            _parsed_call_based_tests.clear()
+        _parsed_call_based_tests[tests_key] = pickle.dumps(
+            parsed, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    return parsed
+
+
+def tests_cache_key(sample):
+    if "input_output_path" in sample:
+        key = sample["input_output_path"]
+    else:
+        key = hashlib.sha256(sample["input_output"].encode("utf-8")).hexdigest()
+    if "test_range" in sample:
+        start, end = sample["test_range"]
+        key = f"{key}:{start}:{end}"
+    return key
+
+
+def call_based_source(code: str, all_inputs: list, platform) -> str:
+    """The source `grade_call_based` compiles for candidate `code`."""
+    if platform == "humaneval":
+        code = code + "\n\n"
+        for i in all_inputs:
+            code += i + "\n"
+        return make_function(clean_if_name(code))
+    return import_string + "\n\n" + code
+
+
 def grade_call_based(
-    code: str, all_inputs: list, all_outputs: list, fn_name: str, timeout: int, platform
+    code: str,
+    all_inputs: list,
+    all_outputs: list,
+    fn_name: str,
+    timeout: int,
+    platform,
+    tests_key=None,
+    cpu_timeout=None,
 ):
     # call-based clean up logic
     # need to wrap in try-catch logic after to catch the correct errors, but for now this is fine.
+    code = call_based_source(code, all_inputs, platform)
     if platform == "humaneval":
-        code = code + "\n\n"
-        for i in all_inputs:
-            code += i + "\n"
-        code = clean_if_name(code)
-        code = make_function(code)
         compiled_sol = compile_code(code, timeout)
         if compiled_sol is None:
             return
@@ -264,7 +523,6 @@ def grade_call_based(
         if method is None:
             return
     else:
-        code = import_string + "\n\n" + code
         compiled_sol = compile_code(code, timeout)
         # import ipdb; ipdb.set_trace()
         if compiled_sol is None:
@@ -272,26 +530,29 @@ def grade_call_based(
         method = get_function(compiled_sol, fn_name)
         if method is None:
             return
-        all_inputs = [
-            [json.loads(line) for line in inputs.split("\n")] for inputs in all_inputs
-        ]
-        all_outputs = [json.loads(output) for output in all_outputs]
+        all_inputs, all_outputs = parse_call_based_tests(
+            all_inputs, all_outputs, tests_key
+        )
 
+    cpu_limit, wall_limit = test_time_limits(timeout, cpu_timeout)
     total_execution = 0
+    total_cpu = 0
     all_results = []
     for idx, (gt_inp, gt_out) in enumerate(zip(all_inputs, all_outputs)):
-        signal.alarm(timeout)
+        arm_time_limit(cpu_limit, wall_limit)
         faulthandler.enable()
         try:
             # can lock here so time is useful
             start = time.time()
+            cpu_start = time.process_time()
             if platform != "humaneval":
                 prediction = method(*gt_inp)
             else:
                 call_method(method, gt_inp)
                 prediction = ""
             total_execution += time.time() - start
-            signal.alarm(0)
+            total_cpu += time.process_time() - cpu_start
+            disarm_time_limit(cpu_limit)
 
             # don't penalize model if it produces tuples instead of lists
             # ground truth sequences are not tuples
@@ -315,7 +576,7 @@ def grade_call_based(
                     "error_message": "Wrong Answer",
                 }
         except Exception as e:
-            signal.alarm(0)
+            disarm_time_limit(cpu_limit)
             if "timeoutexception" in repr(e).lower():
                 all_results.append(-3)
                 return all_results, {
@@ -325,6 +586,9 @@ def grade_call_based(
                     "inputs": truncatefn(gt_inp),
                     "expected": truncatefn(gt_out),
                 }
+            elif isinstance(e, MemoryError):
+                all_results.append(-6)
+                return all_results, memory_limit_metadata(e, gt_inp, gt_out)
             else:
                 all_results.append(-4)
                 return all_results, {
@@ -336,10 +600,162 @@ def grade_call_based(
                 }
 
         finally:
-            signal.alarm(0)
+            disarm_time_limit(cpu_limit)
             faulthandler.disable()
 
-    return all_results, {"execution time": total_execution}
+    return all_results, {"execution time": total_execution, "cpu time": total_cpu}
+
+
+STDIO_ENGINES = ("patch", "fork")
+
+
+def _stdin_file(inputs: str) -> int:
+    data = inputs.encode("utf-8")
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("lcb_stdin")
+    else:
+        fd, path = tempfile.mkstemp(prefix="lcb_stdin_")
+        os.unlink(path)
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+    os.lseek(fd, 0, os.SEEK_SET)
+    return fd
+
+
+def _run_forked_child(program, uses_prelude, stdin_fd, stdout_fd, error_fd, cpu_limit):
+    exit_code = 1
+    try:
+        os.dup2(stdin_fd, 0)
+        os.dup2(stdout_fd, 1)
+        import resource
+
+        # SIGPROF kills the child once it used `cpu_limit` seconds of CPU;
+        # RLIMIT_CPU (whole seconds) is the kernel-side backstop
+        hard_limit = int(cpu_limit) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (hard_limit, hard_limit + 1))
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        signal.setitimer(signal.ITIMER_PROF, cpu_limit)
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        exit_code = 0
+        try:
+            namespace = fresh_namespace(
+                uses_prelude, {"__name__": "__main__", "__builtins__": __builtins__}
+            )
+            if uses_prelude:
+                # `from sys import *` bound the worker's streams
+                namespace.update(stdin=sys.stdin, stdout=sys.stdout)
+            exec(program, namespace)
+        except SystemExit:
+            pass
+        except BaseException as e:
+            os.write(error_fd, repr(e)[:4096].encode("utf-8", "replace"))
+            exit_code = 1
+        sys.stdout.flush()
+    except BaseException as e:
+        try:
+            os.write(error_fd, repr(e)[:4096].encode("utf-8", "replace"))
+        except BaseException:
+            pass
+        exit_code = 1
+    finally:
+        os._exit(exit_code)
+
+
+def run_stdio_program(
+    program, inputs, cpu_limit, wall_limit, uses_prelude: bool = False
+):
+    """Run the compiled stdin/stdout `program` in a forked child.
+
+    The child reads `inputs` from a real file on fd 0 and writes to a pipe on
+    fd 1, so `sys.stdin.buffer`, `os.read(0, ...)` and friends work as they do
+    on a judge. It starts from this (already warm) interpreter and is limited
+    to `cpu_limit` seconds of CPU time; it is killed after `wall_limit`
+    seconds to catch programs that sleep.
+
+    `program` and `uses_prelude` come from `compile_program`.
+    Returns `(stdout, error, elapsed, cpu_time, peak_memory)`, the peak RSS
+    in MiB; `error` is None, a `TimeoutException` or the repr of the
+    exception the program raised.
+    """
+    if isinstance(inputs, list):
+        inputs = "\n".join(inputs)
+    stdin_fd = _stdin_file(inputs)
+    stdout_r, stdout_w = os.pipe()
+    error_r, error_w = os.pipe()
+    start = time.time()
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdout_r)
+        os.close(error_r)
+        _run_forked_child(program, uses_prelude, stdin_fd, stdout_w, error_w, cpu_limit)
+    os.close(stdin_fd)
+    os.close(stdout_w)
+    os.close(error_w)
+
+    chunks = []
+    timed_out = False
+    deadline = start + wall_limit
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                timed_out = True
+                os.kill(pid, signal.SIGKILL)
+                break
+            ready, _, _ = select.select([stdout_r], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(stdout_r, 1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        _, status, usage = os.wait4(pid, 0)
+        elapsed = time.time() - start
+        cpu_time = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in KiB on Linux
+        peak_memory = usage.ru_maxrss / 1024
+        error = os.read(error_r, 8192).decode("utf-8", "replace")
+    finally:
+        os.close(stdout_r)
+        os.close(error_r)
+
+    stdout = b"".join(chunks).decode("utf-8", "replace")
+    if timed_out or (
+        os.WIFSIGNALED(status)
+        and os.WTERMSIG(status) in (signal.SIGPROF, signal.SIGXCPU, signal.SIGKILL)
+    ):
+        return stdout, TimeoutException(), elapsed, cpu_time, peak_memory
+    if os.WIFSIGNALED(status):
+        return (
+            stdout,
+            f"killed by signal {os.WTERMSIG(status)}",
+            elapsed,
+            cpu_time,
+            peak_memory,
+        )
+    if os.WEXITSTATUS(status) != 0:
+        return (
+            stdout,
+            error or f"exited with code {os.WEXITSTATUS(status)}",
+            elapsed,
+            cpu_time,
+            peak_memory,
+        )
+    return stdout, None, elapsed, cpu_time, peak_memory
+
+
+def stdio_source(code: str, engine: str = "patch") -> tuple[str, str]:
+    """The `(source, filename)` `grade_stdio` compiles for candidate `code`."""
+    ## runtime doesn't interact well with __name__ == '__main__'
+    code = clean_if_name(code)
+    if engine == "fork":
+        return import_string + "\n" + code, "<solution>"
+    ## we wrap the given code inside another function
+    return make_function(code), "<string>"
 
 
 def grade_stdio(
@@ -347,67 +763,115 @@ def grade_stdio(
     all_inputs: list,
     all_outputs: list,
     timeout: int,
+    engine: str = "patch",
+    cpu_timeout=None,
 ):
-    ## runtime doesn't interact well with __name__ == '__main__'
-    code = clean_if_name(code)
-
-    ## we wrap the given code inside another function
-    code = make_function(code)
-
-    compiled_sol = compile_code(code, timeout)
-    if compiled_sol is None:
-        return
+    code, filename = stdio_source(code, engine)
+
+    if engine == "fork":
+        # compiled once; every test runs it in a fresh forked child
+        program, uses_prelude = compile_program(code, filename)
+        # build the prelude here so the forked children inherit it
+        prelude_namespace()
+        # the children enforce their own limits; do not let the alarm set
+        # by run_test interrupt the wait for them
+        signal.alarm(0)
+    else:
+        compiled_sol = compile_code(code, timeout)
+        if compiled_sol is None:
+            return
 
-    method = get_function(compiled_sol, "wrapped_function")
+        method = get_function(compiled_sol, "wrapped_function")
 
-    if method is None:
-        return
+        if method is None:
+            return
 
+    cpu_limit, wall_limit = test_time_limits(timeout, cpu_timeout, engine)
+    forked_peak_memory = 0
     all_results = []
     total_execution_time = 0
+    total_cpu_time = 0
     for idx, (gt_inp, gt_out) in enumerate(zip(all_inputs, all_outputs)):
-        signal.alarm(timeout)
-        faulthandler.enable()
-
-        signal.alarm(timeout)
-        with Capturing() as captured_output:
-            try:
-                start = time.time()
-                call_method(method, gt_inp)
-                total_execution_time += time.time() - start
-                # reset the alarm
-                signal.alarm(0)
-            except Exception as e:
-                signal.alarm(0)
-                if "timeoutexception" in repr(e).lower():
-                    all_results.append(-3)
-                    return all_results, {
-                        "error": repr(e),
-                        "error_code": -3,
-                        "error_message": "Time Limit Exceeded",
-                        "inputs": truncatefn(gt_inp),
-                        "expected": truncatefn(gt_out),
-                    }
-                else:
-                    all_results.append(-4)
-                    return all_results, {
-                        "error": repr(e),
-                        "error_code": -4,
-                        "error_message": "Runtime Error",
-                        "inputs": truncatefn(gt_inp),
-                        "expected": truncatefn(gt_out),
-                    }
-
-            finally:
-                signal.alarm(0)
-                faulthandler.disable()
-
-        prediction = captured_output[0]
+        if engine == "fork":
+            prediction, error, elapsed, cpu_time, peak_memory = run_stdio_program(
+                program, gt_inp, cpu_limit, wall_limit, uses_prelude
+            )
+            if isinstance(error, TimeoutException):
+                all_results.append(-3)
+                return all_results, {
+                    "error": repr(error),
+                    "error_code": -3,
+                    "error_message": "Time Limit Exceeded",
+                    "inputs": truncatefn(gt_inp),
+                    "expected": truncatefn(gt_out),
+                }
+            if error is not None and error.startswith("MemoryError"):
+                all_results.append(-6)
+                return all_results, memory_limit_metadata(error, gt_inp, gt_out)
+            if error is not None:
+                all_results.append(-4)
+                return all_results, {
+                    "error": error,
+                    "error_code": -4,
+                    "error_message": "Runtime Error",
+                    "inputs": truncatefn(gt_inp),
+                    "expected": truncatefn(gt_out),
+                }
+            total_execution_time += elapsed
+            total_cpu_time += cpu_time
+            forked_peak_memory = max(forked_peak_memory, peak_memory)
+        else:
+            faulthandler.enable()
+
+            arm_time_limit(cpu_limit, wall_limit)
+            with Capturing() as captured_output:
+                try:
+                    start = time.time()
+                    cpu_start = time.process_time()
+                    call_method(method, gt_inp)
+                    total_execution_time += time.time() - start
+                    total_cpu_time += time.process_time() - cpu_start
+                    # reset the alarm
+                    disarm_time_limit(cpu_limit)
+                except Exception as e:
+                    disarm_time_limit(cpu_limit)
+                    if "timeoutexception" in repr(e).lower():
+                        all_results.append(-3)
+                        return all_results, {
+                            "error": repr(e),
+                            "error_code": -3,
+                            "error_message": "Time Limit Exceeded",
+                            "inputs": truncatefn(gt_inp),
+                            "expected": truncatefn(gt_out),
+                        }
+                    elif isinstance(e, MemoryError):
+                        all_results.append(-6)
+                        return all_results, memory_limit_metadata(e, gt_inp, gt_out)
+                    else:
+                        all_results.append(-4)
+                        return all_results, {
+                            "error": repr(e),
+                            "error_code": -4,
+                            "error_message": "Runtime Error",
+                            "inputs": truncatefn(gt_inp),
+                            "expected": truncatefn(gt_out),
+                        }
+
+                finally:
+                    disarm_time_limit(cpu_limit)
+                    faulthandler.disable()
+
+            prediction = captured_output[0]
 
         if gt_out is None or gt_out == "":
             all_results.append(True)
             continue
 
+        ## CASE 0: the whole output matches exactly, so every line does
+        if prediction.strip() == gt_out.strip():
+            all_results.append(True)
+            continue
+
         stripped_prediction_lines = get_stripped_lines(prediction)
         stripped_gt_out_lines = get_stripped_lines(gt_out)
 
@@ -429,63 +893,139 @@ def grade_stdio(
             stripped_prediction_line,
             stripped_gt_out_line,
         ) in enumerate(zip(stripped_prediction_lines, stripped_gt_out_lines)):
-            WA_send_args["error_message"] = (
-                f"Wrong answer at {output_line_idx=}: {truncatefn(stripped_prediction_line)} != {truncatefn(stripped_gt_out_line)}"
-            )
-
             ## CASE 1: exact match
             if stripped_prediction_line == stripped_gt_out_line:
                 continue
 
-            ## CASE 2: element-wise comparision
-            ## if there are floating elements
-            ## use `decimal` library for good floating point comparision
-            ## otherwise gotcha: np.isclose(50000000000000000, 50000000000000001) = True
-            ## note that we should always be able to convert to decimals
-
-            success, decimal_prediction_line = convert_line_to_decimals(
-                stripped_prediction_line
-            )
-            if not success:
-                all_results.append(-2)
-                return all_results, WA_send_args
-            success, decimal_gtout_line = convert_line_to_decimals(stripped_gt_out_line)
-            if not success:
-                all_results.append(-2)
-                return all_results, WA_send_args
-
-            if decimal_prediction_line == decimal_gtout_line:
-                continue
-
-            if (
-                line_has_decimal_token(stripped_prediction_line)
-                or line_has_decimal_token(stripped_gt_out_line)
-            ) and decimal_lines_close(decimal_prediction_line, decimal_gtout_line):
+            if stdio_lines_match(stripped_prediction_line, stripped_gt_out_line):
                 continue
 
+            WA_send_args["error_message"] = (
+                f"Wrong answer at {output_line_idx=}: {truncatefn(stripped_prediction_line)} != {truncatefn(stripped_gt_out_line)}"
+            )
             all_results.append(-2)
             return all_results, WA_send_args
         all_results.append(True)
 
-    return all_results, {"execution time": total_execution_time}
+    metadata = {
+        "execution time": total_execution_time,
+        "cpu time": total_cpu_time,
+    }
+    if engine == "fork":
+        metadata["peak memory"] = forked_peak_memory
+    return all_results, metadata
+
+
+# tests loaded from `TestCaseStore` files, kept per sandbox worker so the
+# candidates of one problem parse them only once
+_loaded_input_outputs = {}
 
 
-def run_test(sample, test=None, debug=False, timeout=6):
+def load_input_output(sample):
+    """The tests of `sample`, inline or from a `TestCaseStore` file.
+
+    A "test_range" `[start, end)` (a shard from `SandboxPool.run_sharded`)
+    selects those tests only.
+    """
+    if "input_output" in sample:
+        in_outs = json.loads(sample["input_output"])
+    else:
+        path = sample["input_output_path"]
+        in_outs = _loaded_input_outputs.get(path)
+        if in_outs is None:
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    in_outs = json.loads(memoryview(data).tobytes())
+            if len(_loaded_input_outputs) >= 8:
+                _loaded_input_outputs.clear()
+            _loaded_input_outputs[path] = in_outs
+    if "test_range" in sample:
+        start, end = sample["test_range"]
+        in_outs = dict(
+            in_outs,
+            inputs=in_outs["inputs"][start:end],
+            outputs=in_outs["outputs"][start:end],
+        )
+    return in_outs
+
+
+def warm_caches(sample, test, stdio_engine="patch"):
+    """Load the tests of `sample` and compile `test` into this process's caches.
+
+    The sandbox worker calls this before forking the child that runs the job,
+    so what the child would have cached is kept for the next job. Errors are
+    ignored; the child hits them again and reports them.
+    """
+    try:
+        in_outs = load_input_output(sample)
+        if not str(test).strip():
+            return
+        if in_outs.get("fn_name") is None:
+            compile_program(*stdio_source(test, stdio_engine))
+            return
+        platform = in_outs["platform"]
+        compile_program(call_based_source(test, in_outs["inputs"], platform))
+        if platform != "humaneval":
+            parse_call_based_tests(
+                in_outs["inputs"], in_outs["outputs"], tests_cache_key(sample)
+            )
+    except Exception:
+        pass
+
+
+def run_test(
+    sample,
+    test=None,
+    debug=False,
+    timeout=6,
+    stdio_engine="patch",
+    cpu_timeout=None,
+    memory_limit_mb=None,
+):
     """
     if test(generated_code) is not None it'll try to run the code.
     otherwise it'll just return an input and output pair.
+    `stdio_engine` picks how stdin programs run: "patch" calls them in this
+    process with patched `sys.stdin`/stdout, "fork" runs every test in a
+    forked child on real file descriptors (see `run_stdio_program`).
+    With `cpu_timeout` (seconds, may be fractional) every test is limited on
+    CPU time instead of wall-clock time, see `test_time_limits`.
+    With `memory_limit_mb` the process running the candidate may map at most
+    that many more MiB for the duration of the call; running out of it is
+    reported as "Memory Limit Exceeded" (error code -6).
+    The metadata reports the peak RSS in MiB as "peak memory" when it can be
+    measured for this call.
     """
+    measured = reset_peak_memory()
+    previous_limits = None
+    if memory_limit_mb:
+        previous_limits = set_memory_limit(int(memory_limit_mb * 1024 * 1024))
+    try:
+        result = _run_test(sample, test, debug, timeout, stdio_engine, cpu_timeout)
+    except MemoryError as e:
+        result = [-6], memory_limit_metadata(e)
+    finally:
+        if previous_limits is not None:
+            restore_memory_limit(previous_limits)
+    _, metadata = result
+    if measured and isinstance(metadata, dict):
+        metadata.setdefault("peak memory", peak_memory())
+    return result
+
+
+def _run_test(sample, test, debug, timeout, stdio_engine, cpu_timeout):
     signal.signal(signal.SIGALRM, timeout_handler)
+    signal.signal(signal.SIGPROF, timeout_handler)
 
     # Disable functionalities that can make destructive changes to the test.
-    # max memory is set to 4GB
+    # the memory limit is applied by `run_test`
     # reliability_guard()
 
     if debug:
         print(f"start = {datetime.now().time()}")
 
     try:
-        in_outs = json.loads(sample["input_output"])
+        in_outs = load_input_output(sample)
     except ValueError as e:
         raise e
         in_outs = None
@@ -522,12 +1062,16 @@ def run_test(sample, test=None, debug=False, timeout=6):
                     all_outputs=in_outs["outputs"],
                     fn_name=method_name,
                     timeout=timeout,
-                    platform=in_outs["platform"]
+                    platform=in_outs["platform"],
+                    tests_key=tests_cache_key(sample),
+                    cpu_timeout=cpu_timeout,
                 )
                 if grade_result is None:
                     return missing_grade_result_metadata(which_type, method_name)
                 results, metadata = grade_result
                 return results, metadata
+            except MemoryError as e:
+                return [-6], memory_limit_metadata(e)
             except Exception as e:
                 return [-4], {
                     "error_code": -4,
@@ -546,11 +1090,15 @@ def run_test(sample, test=None, debug=False, timeout=6):
                     all_inputs=in_outs["inputs"],
                     all_outputs=in_outs["outputs"],
                     timeout=timeout,
+                    engine=stdio_engine,
+                    cpu_timeout=cpu_timeout,
                 )
                 if grade_result is None:
                     return missing_grade_result_metadata(which_type, method_name)
                 results, metadata = grade_result
                 return results, metadata
+            except MemoryError as e:
+                return [-6], memory_limit_metadata(e)
             except Exception as e:
                 return [-4], {
                     "error_code": -4,
@@ -39,6 +39,9 @@ class LanguageModel:
     model_style: LMStyle
     release_date: datetime | None  # XXX Should we use timezone.utc?
     link: str | None = None
+    # the endpoint samples n > 1 choices in one request (vLLM, SGLang), so
+    # the prompt is sent and prefilled once instead of n times
+    native_n: bool = False
 
     def __hash__(self) -> int:
         return hash(self.model_name)
@@ -645,6 +648,7 @@ LanguageModelList: list[LanguageModel] = [
         LMStyle.LocalAPI,
         datetime(2026, 6, 4),
         link="http://127.0.0.1:8000/v1",
+        native_n=True,
     ),
     LanguageModel(
         "model/DeepSeek-R1-Distill-Qwen-14B",
@@ -652,6 +656,7 @@ LanguageModelList: list[LanguageModel] = [
         LMStyle.LocalAPI,
         datetime(2025, 1, 20),
         link="http://127.0.0.1:8000/v1",
+        native_n=True,
     ),
     LanguageModel(
         "model/DeepSeek-R1-Distill-Qwen-32B",
@@ -149,6 +149,11 @@ def get_check_prompt(question: str, result, metadata):
                         f"Error Details: {metadata.get('error', 'N/A')}") # Assuming 'error' might have more details than 'error_message'
         else:
              message = f"Context: The program previously encountered a runtime error.\nError Message: {metadata.get('error_message', 'N/A')}"
+    elif error_code == -6: # Memory Limit Exceeded
+        message = (f"Context: The program previously exceeded the memory limit.\n"
+                   f"Details: {metadata.get('error', 'N/A')}\n"
+                   f"Input: {metadata.get('inputs', 'N/A')}\n"
+                   f"Expected Output: {metadata.get('expected', 'N/A')}")
     elif error_code == -5: # TestRunnerError
         message = (f"Context: The program previously caused a TestRunnerError.\n"
                    f"Error: {metadata.get('error', 'N/A')}\n"
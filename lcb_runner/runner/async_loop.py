@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+
+class BackgroundEventLoop:
+    """An asyncio event loop running forever in a daemon thread.
+
+    API runners keep their `httpx.AsyncClient` (and its keep-alive
+    connections) on this one loop for their whole lifetime, instead of
+    starting a new loop with `asyncio.run` for every batch. Any thread can
+    hand it a coroutine with `submit`, which returns a
+    `concurrent.futures.Future`, or block on one with `run`.
+    """
+
+    def __init__(self, name="lcb-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def _run_forever(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("BackgroundEventLoop.run called from its own loop thread")
+        return self.submit(coro).result()
+
+    def close(self, cleanup=None):
+        """Run the `cleanup` coroutine, if any, then stop the loop and its thread."""
+        if self.loop.is_closed():
+            return
+        if cleanup is not None:
+            try:
+                self.run(cleanup)
+            except Exception as exc:
+                print(f"event loop cleanup failed: {exc}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
@@ -7,6 +7,8 @@ from tqdm import tqdm
 from lcb_runner.lm_styles import LanguageModel
 from lcb_runner.utils.path_utils import get_cache_path
 from lcb_runner.utils.multiprocess import run_tasks_in_parallel
+from lcb_runner.utils.record_store import RecordStore
+from lcb_runner.runner.response_cache import ResponseCache, prompt_cache_key
 from lcb_runner.runner.scenario_router import Scenario, TestCaseForRepair
 
 
@@ -34,19 +36,42 @@ class BaseRunner(ABC):
 
         if self.args.use_cache:
             self.cache_path = get_cache_path(model.model_repr, args)
-            if os.path.exists(self.cache_path):
-                with open(self.cache_path) as f:
-                    self.cache: dict = json.load(f)
-            else:
-                self.cache = {}
+            self.cache = ResponseCache(
+                self.cache_path.replace(".json", ""),
+                params=self.cache_params(),
+                compress=getattr(args, "cache_compress", False),
+            )
+            if len(self.cache) == 0 and os.path.exists(self.cache_path):
+                self.import_legacy_cache(self.cache_path)
+            if getattr(args, "compact_cache", False):
+                self.cache.compact()
         else:
             self.cache_path = None
             self.cache = None
 
+    def cache_params(self) -> dict:
+        """Sampling parameters that are part of every response cache key."""
+        return {
+            "model": self.model.model_repr,
+            "temperature": self.args.temperature,
+            "top_p": getattr(self.args, "top_p", None),
+            "max_tokens": getattr(self.args, "max_tokens", None),
+            "stop": getattr(self.args, "stop", None),
+        }
+
+    def import_legacy_cache(self, path: str):
+        """Copy the entries of an old `<scenario>_n_temp.json` cache into `self.cache`."""
+        with open(path) as f:
+            legacy_cache: dict = json.load(f)
+        print(f"Importing {len(legacy_cache)} responses from the legacy cache {path}")
+        # the legacy keys are already `prompt_cache_key` strings
+        for prompt_cache, output in legacy_cache.items():
+            self.cache.put(prompt_cache, output)
+        self.cache.flush()
+
     def save_cache(self):
         if self.args.use_cache:
-            with open(self.cache_path, "w") as f:
-                json.dump(self.cache, f, indent=4)
+            self.cache.flush()
 
     # @abstractmethod
     def _run_single(self, prompt: str | list[dict[str, str]]) -> list[str]:
@@ -60,37 +85,61 @@ class BaseRunner(ABC):
         Calls the _run_single method with the combined arguments
         """
         prompt: str | list[dict[str, str]]
-        cache: dict[str, str]
         call_method: callable
-        prompt, cache, args, call_method = combined_args
-
-        if isinstance(prompt, list):
-            prompt_cache = json.dumps(prompt)
-        elif isinstance(prompt, tuple):
-            prompt_cache = prompt[0] + json.dumps(prompt[1])
-        else:
-            prompt_cache = prompt      
-
-        if cache is not None and prompt_cache in cache:
-            if len(cache[prompt_cache]) == args.n:
-                return cache[prompt_cache]
+        prompt, args, call_method = combined_args
 
         result = call_method(prompt)
         assert len(result) == args.n
 
         return result
 
+    def lookup_cache(self, prompts: list) -> tuple[list, list]:
+        """Resolve cache hits for `prompts` in this process.
+
+        Returns `(outputs, pending)`. `outputs[i]` holds the cached outputs of
+        `prompts[i]`, or None. `pending` has one `(prompt, indices)` entry per
+        distinct uncached prompt, so each is sent to the model only once.
+        """
+        outputs = [None for _ in prompts]
+        pending = {}
+        for index, prompt in enumerate(prompts):
+            if self.cache is not None:
+                cached = self.cache.get(prompt)
+                if cached is not None and len(cached) == self.args.n:
+                    outputs[index] = cached
+                    continue
+            key = prompt_cache_key(prompt)
+            if key not in pending:
+                pending[key] = (prompt, [])
+            pending[key][1].append(index)
+        return outputs, list(pending.values())
+
+    def store_outputs(self, outputs: list, pending: list, results: list):
+        """Fill `outputs` from `results`, one per `pending` entry, and cache them.
+
+        A None result marks a failed request: it becomes `n` empty outputs and
+        is not cached, so the next run asks again.
+        """
+        for (prompt, indices), result in zip(pending, results):
+            if result is None:
+                result = [""] * self.args.n
+            elif self.cache is not None:
+                self.cache.put(prompt, result)  ## save the output to cache
+            for index in indices:
+                outputs[index] = result
+
     def run_batch(self, prompts: list[str | list[dict[str, str]]]) -> list[list[str]]:
-        outputs = []
+        outputs, pending = self.lookup_cache(prompts)
+        # workers only get the uncached prompts, never the cache itself
         arguments = [
             (
                 prompt,
-                self.cache,  ## pass the cache as argument for cache check
-                self.args,  ## pass the args as argument for cache check
+                self.args,  ## pass the args as argument for the output check
                 self._run_single,  ## pass the _run_single method as argument because of multiprocessing
             )
-            for prompt in prompts
+            for prompt, _ in pending
         ]
+        results = []
         if self.args.multiprocess > 1:
             parallel_outputs = run_tasks_in_parallel(
                 self.run_single,
@@ -100,40 +149,39 @@ class BaseRunner(ABC):
             )
             for output in parallel_outputs:
                 if output.is_success():
-                    outputs.append(output.result)
+                    results.append(output.result)
                 else:
                     print("Failed to run the model for some prompts")
                     print(output.status)
                     print(output.exception_tb)
-                    outputs.extend([""] * self.args.n)
+                    results.append(None)
         else:
-            outputs = [self.run_single(argument) for argument in tqdm(arguments)]
-
-        if self.args.use_cache:
-            for prompt, output in zip(prompts, outputs):
-                if isinstance(prompt, list):
-                    prompt_cache = json.dumps(prompt)
-                elif isinstance(prompt, tuple):
-                    prompt_cache = prompt[0] + json.dumps(prompt[1])
-                else:
-                    prompt_cache = prompt
-                self.cache[prompt_cache] = output  ## save the output to cache
+            results = [self.run_single(argument) for argument in tqdm(arguments)]
 
+        self.store_outputs(outputs, pending, results)
         return outputs
 
     def prompts_to_outputs(
         self, prompts: list[str | list[dict[str, str]]]
     ) -> list[list[str]]:
+        # send prompts that share a prefix (template, question, code) next to
+        # each other, in the same batch, so the server reuses their cached KV;
+        # the cache key keeps the messages in order, so sorting it groups them
+        order = sorted(range(len(prompts)), key=lambda i: prompt_cache_key(prompts[i]))
+        ordered_prompts = [prompts[i] for i in order]
         if self.args.use_cache:
-            outputs = []
+            ordered_outputs = []
             batch_size = self.args.cache_batch_size
-            for i in range(0, len(prompts), batch_size):
-                batch = prompts[i : i + batch_size]
+            for i in range(0, len(ordered_prompts), batch_size):
+                batch = ordered_prompts[i : i + batch_size]
                 batch_outputs = self.run_batch(batch)
-                outputs.extend(batch_outputs)
+                ordered_outputs.extend(batch_outputs)
                 self.save_cache()
         else:
-            outputs = self.run_batch(prompts)
+            ordered_outputs = self.run_batch(ordered_prompts)
+        outputs = [None for _ in prompts]
+        for index, output in zip(order, ordered_outputs):
+            outputs[index] = output
         return outputs
 
     def run_main_repair(self, benchmark: list, format_prompt: callable) -> list[list[str]]:
@@ -163,7 +211,15 @@ class BaseRunner(ABC):
         if self.args.scenario == Scenario.checkerextend:
             from lcb_runner.runner.our_method import MyPipeline
             mypipeline = MyPipeline(self.args)
-            outputs = mypipeline.our_method_pipeline(benchmark, self.model.model_style, self.args, check_metadata_list, self.prompts_to_outputs)
+            outputs = mypipeline.our_method_pipeline(
+                benchmark,
+                self.model.model_style,
+                self.args,
+                check_metadata_list,
+                self.prompts_to_outputs,
+                # runners with their own event loop take prompts one at a time
+                submit_prompt=getattr(self, "submit_prompt", None),
+            )
             return outputs
         
         outputs = [
@@ -174,64 +230,64 @@ class BaseRunner(ABC):
         prompt_index_to_question_idx = {}
         prompt_index_to_code_idx = {}
         count = 0
+        check_metadata_store = RecordStore(check_metadata_list)
 
         for problem_idx, problem in enumerate(benchmark):
-            for check_metadata_idx, check_metadata in enumerate(check_metadata_list):
-                if problem.question_id == check_metadata['question_id']:
-                    count += 1 
-                    question_content = check_metadata["question_content"]
-                    code_list = check_metadata["code_list"]
-                    output_list = check_metadata["output_list"]
-                    graded_list = check_metadata["graded_list"]
-                    public_graded_list = check_metadata["public_graded_list"]
-                    platform = check_metadata["platform"]
-                    metadata = check_metadata["metadata"]
-                    for code_idx in range(len(code_list)):
-                        if self.args.scenario == Scenario.selfrepair:
-                            prompt_metadata = _metadata_with_problem_interface(
-                                metadata[code_idx],
-                                problem,
-                                platform,
-                            )
-                            prompt = format_prompt(
-                                question_content,
-                                self.model.model_style,
-                                code_list[code_idx],
-                                graded_list[code_idx],
-                                prompt_metadata,
-                            )
-                            if self.args.testcaseforrepair == TestCaseForRepair.publiccase and public_graded_list[code_idx]:
-                                prompt = ""
-                            if prompt == "":
-                                outputs[problem_idx][code_idx] = output_list[code_idx]
-                                continue
-                        elif self.args.scenario == Scenario.testcasegeneration:
-                            prompt = format_prompt(
-                                question_content,
-                                self.model.model_style,
-                                code_list[code_idx],
-                                graded_list[code_idx],
-                                platform,
-                            )
-                            if prompt == "":
-                                outputs[problem_idx][code_idx] = ""
-                                continue
-                        elif self.args.scenario == Scenario.checkerextend:
-                            prompt = format_prompt(
-                                question_content,
-                                self.model.model_style,
-                                code_list[code_idx],
-                                graded_list[code_idx],
-                                metadata[code_idx],
-                            )
-                            if self.args.testcaseforrepair == TestCaseForRepair.publiccase and public_graded_list[code_idx]:
-                                prompt = ""
-                            if prompt == "":
-                                outputs[problem_idx][code_idx] = output_list[code_idx]
-                                continue
-                        prompts.append(prompt)
-                        prompt_index_to_question_idx[len(prompts) - 1] = problem_idx
-                        prompt_index_to_code_idx[len(prompts) - 1] = code_idx
+            for check_metadata in check_metadata_store.matches(problem.question_id):
+                count += 1 
+                question_content = check_metadata["question_content"]
+                code_list = check_metadata["code_list"]
+                output_list = check_metadata["output_list"]
+                graded_list = check_metadata["graded_list"]
+                public_graded_list = check_metadata["public_graded_list"]
+                platform = check_metadata["platform"]
+                metadata = check_metadata["metadata"]
+                for code_idx in range(len(code_list)):
+                    if self.args.scenario == Scenario.selfrepair:
+                        prompt_metadata = _metadata_with_problem_interface(
+                            metadata[code_idx],
+                            problem,
+                            platform,
+                        )
+                        prompt = format_prompt(
+                            question_content,
+                            self.model.model_style,
+                            code_list[code_idx],
+                            graded_list[code_idx],
+                            prompt_metadata,
+                        )
+                        if self.args.testcaseforrepair == TestCaseForRepair.publiccase and public_graded_list[code_idx]:
+                            prompt = ""
+                        if prompt == "":
+                            outputs[problem_idx][code_idx] = output_list[code_idx]
+                            continue
+                    elif self.args.scenario == Scenario.testcasegeneration:
+                        prompt = format_prompt(
+                            question_content,
+                            self.model.model_style,
+                            code_list[code_idx],
+                            graded_list[code_idx],
+                            platform,
+                        )
+                        if prompt == "":
+                            outputs[problem_idx][code_idx] = ""
+                            continue
+                    elif self.args.scenario == Scenario.checkerextend:
+                        prompt = format_prompt(
+                            question_content,
+                            self.model.model_style,
+                            code_list[code_idx],
+                            graded_list[code_idx],
+                            metadata[code_idx],
+                        )
+                        if self.args.testcaseforrepair == TestCaseForRepair.publiccase and public_graded_list[code_idx]:
+                            prompt = ""
+                        if prompt == "":
+                            outputs[problem_idx][code_idx] = output_list[code_idx]
+                            continue
+                    prompts.append(prompt)
+                    prompt_index_to_question_idx[len(prompts) - 1] = problem_idx
+                    prompt_index_to_code_idx[len(prompts) - 1] = code_idx
 
         assert len(benchmark)==count, f"{len(benchmark)=}!={count=}"
 
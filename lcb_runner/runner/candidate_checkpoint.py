@@ -0,0 +1,71 @@
+"""Incremental checkpoint of checkerextend results.
+
+Every repaired candidate is appended to `<path>.partial` as one JSON line as
+soon as its worker finishes, so a crash only loses the candidates that were
+in flight. `finalize` atomically renames the partial file to `path`. With
+`resume=True`, the candidates recorded by an earlier run (partial or final)
+are loaded into `done` and kept in the new checkpoint.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class CandidateCheckpoint:
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.partial_path = path + ".partial"
+        self._lock = threading.Lock()
+        self.done = {}
+        if resume:
+            for candidate_path in (self.partial_path, self.path):
+                if os.path.exists(candidate_path):
+                    self.done = self.load(candidate_path)
+                    print(
+                        f"Resuming checkerextend from {len(self.done)} checkpointed candidates in {candidate_path}"
+                    )
+                    break
+        Path(self.partial_path).parent.mkdir(parents=True, exist_ok=True)
+        # rewrite the partial file from what was loaded: this drops a line
+        # truncated by a crash, and keeps resumed candidates in the final file
+        tmp_path = self.partial_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for (question_id, code_idx), output in self.done.items():
+                f.write(self._line(question_id, code_idx, output))
+        os.replace(tmp_path, self.partial_path)
+        self._file = open(self.partial_path, "a")
+
+    @staticmethod
+    def _line(question_id, code_idx, output):
+        record = {"question_id": question_id, "code_idx": code_idx, "output": output}
+        return json.dumps(record) + "\n"
+
+    @staticmethod
+    def load(path):
+        done = {}
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a crashed run may be cut short
+                    continue
+                done[(record["question_id"], record["code_idx"])] = record["output"]
+        return done
+
+    def get(self, question_id, code_idx):
+        return self.done.get((question_id, code_idx))
+
+    def append(self, question_id, code_idx, output):
+        line = self._line(question_id, code_idx, output)
+        with self._lock:
+            self.done[(question_id, code_idx)] = output
+            self._file.write(line)
+            self._file.flush()
+
+    def finalize(self):
+        with self._lock:
+            self._file.close()
+            os.replace(self.partial_path, self.path)
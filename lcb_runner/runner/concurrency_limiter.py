@@ -0,0 +1,239 @@
+import asyncio
+import contextlib
+import email.utils
+import random
+import re
+import threading
+import time
+
+
+def error_status(error: BaseException) -> int | None:
+    """HTTP status of an `openai`/`httpx` error, if it has one."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """True for errors meaning the backend is overloaded: 429, 5xx or a timeout."""
+    status = error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(error).__name__
+
+
+def rejects_parameter(error: BaseException, name: str) -> bool:
+    """True for a 400/422 error whose message names request parameter `name`.
+
+    vLLM and SGLang answer 400 for per-request problems too (a prompt over
+    `max_model_len`), so the status alone does not say which field was wrong.
+    """
+    if error_status(error) not in (400, 422):
+        return False
+    text = f"{error} {getattr(error, 'body', '')}"
+    # `name` as a word, not as part of one or of an escaped "\\n"
+    return re.search(rf"(?<![\w\\]){re.escape(name)}(?!\w)", text) is not None
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """The delay requested by the `Retry-After` header of an error response."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the requests in flight to one backend, with backoff.
+
+    Every request runs inside `slot()` (threads) or `slot_async()` (one
+    event loop). A request that succeeds while all slots were taken and
+    latency is healthy (within `latency_tolerance` of the recent floor)
+    raises the limit by 1/limit, so about one slot per round of requests.
+    A 429, 5xx or timeout multiplies the limit by `decrease_factor`, once
+    per round: requests already in flight when the limit dropped do not
+    drop it again. It also pauses new requests for the `Retry-After` delay,
+    or else a jittered exponential delay. `summary` reports throughput and
+    backpressure (time spent waiting for a slot).
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int | None = None,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 3.0,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 60.0,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit or initial)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._cond = threading.Condition()
+        self._async_waiters = []
+        self._in_flight = 0
+        self._backoff_until = 0.0
+        self._last_decrease_at = 0.0
+        self._consecutive_overloads = 0
+        self._latency_ema = None
+        self._latency_floor = None
+        self._created_at = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.overloaded = 0
+        self.wait_seconds = 0.0
+        self.backoff_seconds = 0.0
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential delay for retry `attempt` (0-based), half of it random."""
+        delay = min(self.backoff_cap, self.backoff_base * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def retry_delay(self, attempt: int, error: BaseException) -> float:
+        """How long a caller should wait before retrying after `error`."""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after
+        return self.backoff_delay(attempt)
+
+    def _wait_time(self, now: float) -> float | None:
+        """0 if a request can start now, else the seconds to wait (None: until a release)."""
+        if now < self._backoff_until:
+            return self._backoff_until - now
+        if self._in_flight < int(self.limit):
+            return 0
+        return None
+
+    def acquire(self) -> float:
+        """Wait for a slot; returns the request's start time for `release`."""
+        requested = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait == 0:
+                    return self._start(requested, now)
+                self._cond.wait(wait)
+
+    async def acquire_async(self) -> float:
+        requested = time.monotonic()
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait == 0:
+                    return self._start(requested, now)
+                woken = asyncio.Event()
+                self._async_waiters.append((loop, woken))
+            try:
+                await asyncio.wait_for(woken.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, requested: float, now: float) -> float:
+        self._in_flight += 1
+        self.wait_seconds += now - requested
+        return now
+
+    def release(self, start: float, error: BaseException | None = None):
+        """Free the slot of a request started at `start` and adapt the limit."""
+        now = time.monotonic()
+        with self._cond:
+            was_full = self._in_flight >= int(self.limit)
+            self._in_flight -= 1
+            if error is None:
+                self._succeeded(now - start, was_full)
+            elif isinstance(error, asyncio.CancelledError):
+                pass
+            elif is_overload_error(error):
+                self._overloaded(start, now, error)
+            else:
+                self.failed += 1
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, woken in waiters:
+            loop.call_soon_threadsafe(woken.set)
+
+    def _succeeded(self, latency: float, was_full: bool):
+        self.completed += 1
+        self._consecutive_overloads = 0
+        if self._latency_ema is None:
+            self._latency_ema = self._latency_floor = latency
+        else:
+            self._latency_ema = 0.8 * self._latency_ema + 0.2 * latency
+            # the floor follows slowly rising workloads (longer outputs) too
+            self._latency_floor = min(self._latency_ema, self._latency_floor * 1.05)
+        healthy = self._latency_ema <= self.latency_tolerance * self._latency_floor
+        if was_full and healthy:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _overloaded(self, start: float, now: float, error: BaseException):
+        self.failed += 1
+        self.overloaded += 1
+        if start >= self._last_decrease_at:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease_at = now
+        delay = self.retry_delay(self._consecutive_overloads, error)
+        self._consecutive_overloads += 1
+        if now + delay > self._backoff_until:
+            self.backoff_seconds += now + delay - max(now, self._backoff_until)
+            self._backoff_until = now + delay
+
+    @contextlib.contextmanager
+    def slot(self):
+        start = self.acquire()
+        try:
+            yield
+        except BaseException as exc:
+            self.release(start, exc)
+            raise
+        self.release(start)
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self):
+        start = await self.acquire_async()
+        try:
+            yield
+        except BaseException as exc:
+            self.release(start, exc)
+            raise
+        self.release(start)
+
+    def summary(self) -> str:
+        with self._cond:
+            elapsed = max(time.monotonic() - self._created_at, 1e-9)
+            started = self.completed + self.failed
+            return (
+                f"concurrency limit {self.limit:.1f} (max {self.max_limit}), "
+                f"{self.completed} ok / {self.failed} failed ({self.overloaded} overloaded), "
+                f"{self.completed / elapsed:.2f} req/s, "
+                f"avg wait for a slot {self.wait_seconds / max(started, 1):.2f}s, "
+                f"backed off {self.backoff_seconds:.1f}s"
+            )
+
+
+def get_concurrency_limiter(args, concurrency: int) -> AdaptiveConcurrencyLimiter:
+    """A fixed limit of `concurrency`, or an adaptive one with --adaptive_concurrency."""
+    concurrency = max(1, concurrency)
+    if getattr(args, "adaptive_concurrency", False):
+        max_limit = getattr(args, "max_adaptive_concurrency", 0) or 4 * concurrency
+        return AdaptiveConcurrencyLimiter(concurrency, max_limit=max_limit)
+    return AdaptiveConcurrencyLimiter(concurrency, min_limit=concurrency, max_limit=concurrency)
@@ -1,19 +1,65 @@
 import asyncio
+import atexit
 import os
+import threading
+from concurrent.futures import Future
 import httpx
-import nest_asyncio  # import early to avoid duplicate calls
 from openai import AsyncOpenAI
 from typing import List, Dict, Any
 import json
 from tqdm import tqdm
+from lcb_runner.runner.async_loop import BackgroundEventLoop
 from lcb_runner.runner.base_runner import BaseRunner
+from lcb_runner.runner.concurrency_limiter import get_concurrency_limiter, rejects_parameter
+from lcb_runner.runner.stream_stop import StreamStats, StreamStop
+
+# Prometheus counters of vLLM >= 0.8, and hit rate gauges of older vLLM and SGLang
+PREFIX_CACHE_COUNTERS = {"vllm:prefix_cache_hits": "hits", "vllm:prefix_cache_queries": "queries"}
+PREFIX_CACHE_GAUGES = ("vllm:gpu_prefix_cache_hit_rate", "sglang:cache_hit_rate")
+
+
+def parse_prefix_cache_metrics(text: str) -> dict:
+    """Sum the prefix cache metrics of a Prometheus `/metrics` page over their labels.
+
+    Returns `{"hits": ..., "queries": ...}` (in tokens) from counters, or
+    `{"hit_rate": ...}` from a gauge, or {} when the server exports neither.
+    """
+    counters = {}
+    gauges = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        name = name.split("{")[0].strip()
+        try:
+            value = float(value)
+        except ValueError:
+            continue
+        if name.endswith("_total"):
+            name = name[: -len("_total")]
+        if name in PREFIX_CACHE_COUNTERS:
+            key = PREFIX_CACHE_COUNTERS[name]
+            counters[key] = counters.get(key, 0.0) + value
+        elif name in PREFIX_CACHE_GAUGES:
+            gauges.append(value)
+    if len(counters) == 2:
+        return counters
+    if gauges:
+        return {"hit_rate": sum(gauges) / len(gauges)}
+    return {}
 
 
 class LocalAPIRunner(BaseRunner):
     def __init__(self, args, model):
         super().__init__(args, model)
 
+        # one loop for the runner's lifetime: the client's connection pool and
+        # the concurrency limit are shared by every batch and submitted prompt
+        self.event_loop = BackgroundEventLoop(name="localapi-event-loop")
+
         base_url = getattr(args, "api_base_url", None) or model.link
+        # the server's Prometheus metrics live next to /v1, not under it
+        self.metrics_url = base_url.rstrip("/").removesuffix("/v1") + "/metrics"
         is_loopback = "localhost" in base_url or "127.0.0.1" in base_url
         verify_ssl = not is_loopback and not getattr(args, "no_verify_ssl", False)
         
@@ -30,6 +76,8 @@ class LocalAPIRunner(BaseRunner):
             api_key=api_key,
             base_url=base_url,
             http_client=self.http_client,
+            # retries go through self.limiter, which must see every 429/5xx
+            max_retries=0,
         )
 
         self.client_kwargs: Dict[str, Any] = {
@@ -39,13 +87,32 @@ class LocalAPIRunner(BaseRunner):
             # "top_p": args.top_p,
             "frequency_penalty": 0,
             "presence_penalty": 0,
-            "n": 1,  # API limit
+            "n": 1,  # one request per sample unless native_n
         }
         extra_body = self._build_extra_body(args)
         if extra_body:
             self.client_kwargs["extra_body"] = extra_body
         
         self.max_concurrency = getattr(args, 'max_concurrency', 8)
+        # every HTTP request, including the n of one prompt, takes a slot
+        self.limiter = get_concurrency_limiter(args, self.max_concurrency)
+        self._cache_lock = threading.Lock()
+        self._unflushed_outputs = 0
+
+        self.stream = getattr(args, "stream", False)
+        self.stream_stop = getattr(args, "stream_stop", None)
+        self.stream_timeout = getattr(args, "stream_timeout", None)
+        self.stream_stats = StreamStats(args.max_tokens) if self.stream else None
+        # a stop condition applies to each streamed sample, so streaming fans out
+        self.native_n = getattr(model, "native_n", False) and args.n > 1 and not self.stream
+        atexit.register(self.close)
+
+    def cache_params(self) -> dict:
+        params = super().cache_params()
+        # an early stopped completion lacks the text after the stop condition
+        if getattr(self.args, "stream", False) and getattr(self.args, "stream_stop", None):
+            params["stream_stop"] = self.args.stream_stop
+        return params
 
     @staticmethod
     def _resolve_api_key(args) -> str:
@@ -79,14 +146,6 @@ class LocalAPIRunner(BaseRunner):
             extra_body["chat_template_kwargs"] = chat_template_kwargs
         return extra_body
 
-    @staticmethod
-    def _prompt_cache_key(prompt):
-        if isinstance(prompt, list):
-            return json.dumps(prompt)
-        if isinstance(prompt, tuple):
-            return prompt[0] + json.dumps(prompt[1])
-        return prompt
-
     @staticmethod
     def _normalize_prompt(prompt):
         if not isinstance(prompt, list):
@@ -95,34 +154,45 @@ class LocalAPIRunner(BaseRunner):
 
     def _run_single(self, prompt: List[Dict[str, str]]) -> List[str]:
         """Synchronous entry: run the coroutine via _run_async."""
-        prompt = self._normalize_prompt(prompt)
-
-        # choose coroutine based on n
-        coro = (self._create_completion(prompt)
-                if self.args.n == 1
-                else self._run_parallel(prompt))
-
-        # run async code through the helper method
-        result = self._run_async(coro)
-        return [result] if self.args.n == 1 else result
+        return self._run_async(self._run_single_outputs_async(prompt))
 
     async def _run_single_outputs_async(self, prompt: List[Dict[str, str]]) -> List[str]:
         prompt = self._normalize_prompt(prompt)
         if self.args.n == 1:
             return [await self._create_completion(prompt)]
+        if self.native_n:
+            return await self._run_native_n(prompt)
         return await self._run_parallel(prompt)
 
+    async def _run_native_n(self, prompt: List[Dict[str, str]]) -> List[str]:
+        """Sample all n outputs in one request, or fan out if the server can't."""
+        try:
+            outputs = await self._create_choices(prompt, self.args.n)
+        except Exception as exc:
+            # any other error fails this prompt only, as with n=1
+            if not rejects_parameter(exc, "n"):
+                raise
+            self._disable_native_n(f"{type(exc).__name__}: {exc}")
+            return await self._run_parallel(prompt)
+        if len(outputs) < self.args.n:
+            self._disable_native_n(f"got {len(outputs)} choices for n={self.args.n}")
+            return outputs + await self._run_parallel(prompt, self.args.n - len(outputs))
+        return outputs[: self.args.n]
+
+    def _disable_native_n(self, reason: str):
+        if self.native_n:
+            print(f"⚠️  The server does not support n={self.args.n} ({reason}); sending n requests per prompt")
+            self.native_n = False
+
     async def _run_batch_async(self, indexed_prompts):
-        semaphore = asyncio.Semaphore(self.max_concurrency)
         results = {}
 
         async def run_indexed(index, prompt):
-            async with semaphore:
-                try:
-                    return index, await self._run_single_outputs_async(prompt)
-                except Exception as exc:
-                    print(f"❌ Prompt {index} failed: {exc}")
-                    return index, [""] * self.args.n
+            try:
+                return index, await self._run_single_outputs_async(prompt)
+            except Exception as exc:
+                print(f"❌ Prompt {index} failed: {exc}")
+                return index, None
 
         tasks = [asyncio.create_task(run_indexed(index, prompt)) for index, prompt in indexed_prompts]
         with tqdm(total=len(tasks)) as progress:
@@ -133,69 +203,165 @@ class LocalAPIRunner(BaseRunner):
         return results
 
     def run_batch(self, prompts: list[str | list[dict[str, str]]]) -> list[list[str]]:
-        outputs = [None for _ in prompts]
-        uncached = []
-        for index, prompt in enumerate(prompts):
-            prompt_cache = self._prompt_cache_key(prompt)
-            if (
-                self.cache is not None
-                and prompt_cache in self.cache
-                and len(self.cache[prompt_cache]) == self.args.n
-            ):
-                outputs[index] = self.cache[prompt_cache]
-            else:
-                uncached.append((index, prompt))
-
-        if uncached:
-            batch_results = self._run_async(self._run_batch_async(uncached))
-            for index, output in batch_results.items():
-                assert len(output) == self.args.n
-                outputs[index] = output
+        outputs, pending = self.lookup_cache(prompts)
+        results = []
+        if pending:
+            metrics_before = self._run_async(self._prefix_cache_metrics())
+            batch_results = self._run_async(
+                self._run_batch_async([(index, prompt) for index, (prompt, _) in enumerate(pending)])
+            )
+            for index in range(len(pending)):
+                output = batch_results[index]
+                assert output is None or len(output) == self.args.n
+                results.append(output)
+            if metrics_before:
+                self.report_prefix_cache_hits(metrics_before, self._run_async(self._prefix_cache_metrics()))
+            print(self.limiter.summary())
+            if self.stream_stats is not None:
+                print(self.stream_stats.summary())
+        self.store_outputs(outputs, pending, results)
+        return outputs
 
-        if self.cache is not None:
-            for prompt, output in zip(prompts, outputs):
-                self.cache[self._prompt_cache_key(prompt)] = output
+    async def _prefix_cache_metrics(self) -> dict:
+        """The server's prefix cache metrics; {} once the server turns out not to export any."""
+        if self.metrics_url is None:
+            return {}
+        try:
+            response = await self.http_client.get(self.metrics_url)
+            response.raise_for_status()
+            metrics = parse_prefix_cache_metrics(response.text)
+        except Exception:
+            metrics = {}
+        if not metrics:
+            self.metrics_url = None
+        return metrics
 
-        return outputs
+    @staticmethod
+    def report_prefix_cache_hits(before: dict, after: dict):
+        """Print the server's prefix cache hit rate over one batch."""
+        if "queries" in before and "queries" in after:
+            queries = after["queries"] - before["queries"]
+            hits = after["hits"] - before["hits"]
+            if queries > 0:
+                print(
+                    f"server prefix cache hit rate {hits / queries:.1%} "
+                    f"({hits:.0f}/{queries:.0f} prompt tokens)"
+                )
+        elif "hit_rate" in after:
+            print(f"server prefix cache hit rate {after['hit_rate']:.1%}")
 
     def _run_async(self, coro):
-        """Smart event-loop handler that works in scripts and Jupyter."""
+        """Run `coro` on the runner's event loop and wait for its result.
+
+        Works from any thread, including one that already runs its own loop
+        (e.g. Jupyter), since the coroutine never runs on the caller's loop.
+        """
+        return self.event_loop.run(coro)
+
+    def submit_prompt(self, prompt) -> Future:
+        """Send one prompt without waiting for a batch; thread-safe.
+
+        Returns a `concurrent.futures.Future` of the prompt's `n` outputs. The
+        request shares the connection pool and concurrency limit with
+        every other batch and prompt in flight. A cached prompt resolves
+        immediately; a failed request resolves to `n` empty outputs.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(prompt)
+            if cached is not None and len(cached) == self.args.n:
+                future = Future()
+                future.set_result(cached)
+                return future
+        return self.event_loop.submit(self._submit_prompt_async(prompt))
+
+    async def _submit_prompt_async(self, prompt) -> List[str]:
         try:
-            # check whether an event loop is already running
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            # no running loop: plain script, use asyncio.run directly
-            return asyncio.run(coro)
-        else:
-            # running loop exists (e.g. Jupyter): enable nested execution
-            nest_asyncio.apply()
-            return loop.run_until_complete(coro)
+            outputs = await self._run_single_outputs_async(prompt)
+        except Exception as exc:
+            print(f"❌ Prompt failed: {exc}")
+            return [""] * self.args.n
+        if self.cache is not None:
+            self.cache.put(prompt, outputs)
+            with self._cache_lock:
+                self._unflushed_outputs += 1
+                flush = self._unflushed_outputs >= self.args.cache_batch_size
+                if flush:
+                    self._unflushed_outputs = 0
+            if flush:
+                self.save_cache()
+        return outputs
 
     async def _create_completion(self, prompt: List[Dict[str, str]]) -> str:
-        """Single async request with retry logic."""
+        return (await self._create_choices(prompt, 1))[0]
+
+    async def _create_choices(self, prompt: List[Dict[str, str]], n: int) -> List[str]:
+        """Single async request for `n` choices with retry logic.
+
+        Overload errors (429/5xx/timeouts) also make the limiter lower its
+        limit and pause every request for a while, see `AdaptiveConcurrencyLimiter`.
+        """
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = await self.client.chat.completions.create(
-                    messages=prompt,
-                    **self.client_kwargs,
-                )
-                return response.choices[0].message.content
+                async with self.limiter.slot_async():
+                    if self.stream:
+                        return [await self._stream_completion(prompt)]
+                    response = await self.client.chat.completions.create(
+                        messages=prompt,
+                        **dict(self.client_kwargs, n=n),
+                    )
+                    return [choice.message.content for choice in response.choices]
             except Exception as e:
+                if n > 1 and rejects_parameter(e, "n"):
+                    raise  # the server rejects n; _run_native_n falls back
                 if attempt == max_retries - 1:
                     raise RuntimeError(f"API call failed: {type(e).__name__}: {repr(e)}") from e
                 print(f"⚠️  Retry {attempt+1}/{max_retries}: {type(e).__name__}: {repr(e)}")
-                await asyncio.sleep(5 * (attempt + 1))
+                await asyncio.sleep(self.limiter.retry_delay(attempt, e))
+
+    async def _stream_completion(self, prompt: List[Dict[str, str]]) -> str:
+        """Stream one completion, cancelling it once `stream_stop` is met.
 
-    async def _run_parallel(self, prompt: List[Dict[str, str]]) -> List[str]:
-        """Run n requests in parallel (async mode)."""
-        semaphore = asyncio.Semaphore(self.max_concurrency)
+        When `stream_timeout` runs out, or the connection times out, after
+        some text has arrived, that partial text is returned instead of
+        failing the request.
+        """
+        stop = StreamStop(self.stream_stop) if self.stream_stop else None
+        parts = []
+        stream = await self.client.chat.completions.create(
+            messages=prompt,
+            stream=True,
+            **self.client_kwargs,
+        )
+
+        async def consume():
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                if stop is not None and stop.feed(delta):
+                    return "stopped"
+            return "finished"
 
-        async def fetch_with_semaphore():
-            async with semaphore:
-                return await self._create_completion(prompt)
+        try:
+            reason = await asyncio.wait_for(consume(), self.stream_timeout)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            if not parts:
+                raise
+            reason = "timeout"
+        finally:
+            # closing the response makes the server abort the generation
+            await stream.close()
+        self.stream_stats.record(reason, len(parts))
+        return "".join(parts)
 
-        tasks = [fetch_with_semaphore() for _ in range(self.args.n)]
+    async def _run_parallel(self, prompt: List[Dict[str, str]], count: int | None = None) -> List[str]:
+        """Run n (or `count`) requests in parallel (async mode)."""
+        count = self.args.n if count is None else count
+        tasks = [self._create_completion(prompt) for _ in range(count)]
         results = await asyncio.gather(*tasks, return_exceptions=True)
 
         # Change 1: use "" instead of " " so downstream logic does not treat it as valid content.
@@ -203,22 +369,19 @@ class LocalAPIRunner(BaseRunner):
         processed_results = []
         for i, result in enumerate(results):
             if isinstance(result, Exception):
-                print(f"❌ Task {i+1}/{self.args.n} failed: {result}")
+                print(f"❌ Task {i+1}/{count} failed: {result}")
                 processed_results.append("")  # placeholder for failed request
             else:
                 processed_results.append(result)
 
         return processed_results
 
-    def __del__(self):
-        """Clean up the async HTTP client to avoid resource warnings."""
-        try:
-            # obtain the current loop (or create one) to close the client
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                # schedule async close if the loop is already running
-                loop.create_task(self.http_client.aclose())
-            else:
-                loop.run_until_complete(self.http_client.aclose())
-        except:
-            pass
+    def close(self):
+        """Close the HTTP client and stop the event loop; safe to call twice."""
+        if self.event_loop.loop.is_closed():
+            return
+        self.save_cache()
+        print(self.limiter.summary())
+        if self.stream_stats is not None:
+            print(self.stream_stats.summary())
+        self.event_loop.close(self.http_client.aclose())
@@ -6,6 +6,7 @@ from lcb_runner.utils.scenarios import Scenario
 from lcb_runner.lm_styles import LanguageModelStore
 from lcb_runner.runner.runner_utils import build_runner
 from lcb_runner.utils.path_utils import get_output_path
+from lcb_runner.utils.record_store import RecordStore
 from lcb_runner.evaluation import extract_instance_results
 from lcb_runner.runner.scenario_router import (
     build_prompt_benchmark,
@@ -107,13 +108,11 @@ def main():
             if instance["output_list"]
             # and [x for x in instance["output_list"] if x]
         ]
-        old_save_results_question_ids = [
-            instance["question_id"] for instance in old_save_results
-        ]
+        old_save_results_store = RecordStore(old_save_results)
         remaining_benchmark = [
             instance
             for instance in benchmark
-            if instance.question_id not in old_save_results_question_ids
+            if instance.question_id not in old_save_results_store
         ]
         print(
             f"Found {len(old_save_results)} existing generations, continuing with {len(remaining_benchmark)} remaining"
@@ -160,8 +159,10 @@ def main():
             args.scenario, save_results
         )
 
-    with open(output_path, "w") as f:
+    # write to a temporary file first so a crash never leaves a truncated output
+    with open(output_path + ".tmp", "w") as f:
         json.dump(save_results, f, indent=4)
+    os.replace(output_path + ".tmp", output_path)
 
     if args.evaluate:
         if args.continue_existing_with_eval and os.path.exists(eval_all_file):
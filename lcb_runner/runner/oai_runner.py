@@ -1,6 +1,9 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 
+from tqdm import tqdm
+
 try:
     import openai
     from openai import OpenAI
@@ -9,15 +12,20 @@ except ImportError as e:
 
 from lcb_runner.lm_styles import LMStyle
 from lcb_runner.runner.base_runner import BaseRunner
+from lcb_runner.runner.concurrency_limiter import get_concurrency_limiter
 
 
 class OpenAIRunner(BaseRunner):
     client = OpenAI(
         api_key=os.getenv("OPENAI_KEY"),
+        # retries go through the limiter, which must see every 429/5xx
+        max_retries=0,
     )
 
     def __init__(self, args, model):
         super().__init__(args, model)
+        # --multiprocess requests at once, from threads sharing one limiter
+        self.limiter = get_concurrency_limiter(args, args.multiprocess)
         if model.model_style == LMStyle.OpenAIReasonPreview:
             self.client_kwargs: dict[str | str] = {
                 "model": args.model,
@@ -48,28 +56,62 @@ class OpenAIRunner(BaseRunner):
     def _run_single(self, prompt: list[dict[str, str]]) -> list[str]:
         assert isinstance(prompt, list)
 
-        try:
-            response = OpenAIRunner.client.chat.completions.create(
-                messages=prompt,
-                **self.client_kwargs,
-            )
-        except (
-            openai.APIError,
-            openai.RateLimitError,
-            openai.InternalServerError,
-            openai.OpenAIError,
-            openai.APIStatusError,
-            openai.APITimeoutError,
-            openai.InternalServerError,
-            openai.APIConnectionError,
-        ) as e:
-            print("Exception: ", repr(e))
-            print("Sleeping for 30 seconds...")
-            print("Consider reducing the number of parallel processes.")
-            sleep(30)
-            return self._run_single(prompt)
-        except Exception as e:
-            print(f"Failed to run the model for {prompt}!")
-            print("Exception: ", repr(e))
-            raise e
+        attempt = 0
+        while True:
+            try:
+                with self.limiter.slot():
+                    response = OpenAIRunner.client.chat.completions.create(
+                        messages=prompt,
+                        **self.client_kwargs,
+                    )
+                break
+            except (
+                openai.APIError,
+                openai.RateLimitError,
+                openai.InternalServerError,
+                openai.OpenAIError,
+                openai.APIStatusError,
+                openai.APITimeoutError,
+                openai.InternalServerError,
+                openai.APIConnectionError,
+            ) as e:
+                delay = self.limiter.retry_delay(attempt, e)
+                attempt += 1
+                print("Exception: ", repr(e))
+                print(f"Sleeping for {delay:.1f} seconds...")
+                sleep(delay)
+            except Exception as e:
+                print(f"Failed to run the model for {prompt}!")
+                print("Exception: ", repr(e))
+                raise e
         return [c.message.content for c in response.choices]
+
+    def run_batch(self, prompts: list[str | list[dict[str, str]]]) -> list[list[str]]:
+        outputs, pending = self.lookup_cache(prompts)
+
+        def run_prompt(prompt):
+            # a failed prompt becomes None, like in run_tasks_in_parallel, so
+            # the rest of the batch is still returned and cached
+            try:
+                result = self._run_single(prompt)
+                assert len(result) == self.args.n, (
+                    f"expected {self.args.n} outputs, got {len(result)}"
+                )
+            except Exception as e:
+                print("Failed to run the model for some prompts")
+                print("Exception: ", repr(e))
+                return None
+            return result
+
+        # threads rather than processes, so that they share self.limiter
+        with ThreadPoolExecutor(max_workers=self.limiter.max_limit) as executor:
+            results = list(
+                tqdm(
+                    executor.map(run_prompt, [prompt for prompt, _ in pending]),
+                    total=len(pending),
+                )
+            )
+        if pending:
+            print(self.limiter.summary())
+        self.store_outputs(outputs, pending, results)
+        return outputs
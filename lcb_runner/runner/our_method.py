@@ -5,12 +5,17 @@ import textwrap
 import numpy as np
 from tqdm import tqdm
 import threading
-from queue import Empty, PriorityQueue
+from concurrent.futures import ThreadPoolExecutor
 import time
+import traceback
 import multiprocessing
 from pathlib import Path
 
 from lcb_runner.evaluation.compute_code_generation_metrics import check_correctness
+from lcb_runner.evaluation.sandbox_pool import get_sandbox_pool
+from lcb_runner.runner.candidate_checkpoint import CandidateCheckpoint
+from lcb_runner.runner.pipeline_scheduler import PromptScheduler, StageStats
+from lcb_runner.runner.scenario_router import get_eval_cache, get_run_options
 from lcb_runner.prompts.self_repair import format_prompt_self_repair
 from lcb_runner.prompts.checker_extend import format_prompt_checker_extend, get_metadata
 from lcb_runner.prompts.test_case_generation import format_prompt_testcase_generate
@@ -28,15 +33,18 @@ from lcb_runner.prompts.property_generation import (
 )
 from lcb_runner.prompts.test_inputer_generation import format_prompt_inputer_generate, execute_inputer_script
 from lcb_runner.utils.extraction_utils import extract_code, extract_testcase
+from lcb_runner.utils.record_store import RecordStore
 
 
 run_answer_list = []
 
 
-def run_exec(samples, code, timeout):
+def run_exec(samples, code, timeout, pool=None, cache=None, run_options=None):
     curr_res = [-2]
     try:
-        curr_res, curr_metadata = check_correctness(samples, code, timeout, False)
+        curr_res, curr_metadata = check_correctness(
+            samples, code, timeout, False, pool=pool, cache=cache, run_options=run_options
+        )
         fixed = []
         for e in curr_res:
             if isinstance(e, np.ndarray):
@@ -72,9 +80,9 @@ def append_property_probe_inputs(samples, probe_inputs):
     return {"input_output": json.dumps(merged)}
 
 
-def run_exec_with_workid(samples, code, timeout, work_id):
+def run_exec_with_workid(samples, code, timeout, work_id, pool=None, cache=None, run_options=None):
     # print(f"child process started run_exec for work_id={work_id}")
-    answer = run_exec(samples, code, timeout)
+    answer = run_exec(samples, code, timeout, pool, cache, run_options)
     return answer, work_id
 
 
@@ -314,18 +322,31 @@ class MyPipeline:
     def __init__(self, args) -> None:
         self.args = args
         self.checker_code_log = []
-        self.condition = threading.Condition()
-        self.request_queue = PriorityQueue()  # shared queue between main and worker threads
-        self.prompts_answer_list = []
         self.platform = ""
         global run_answer_list
         run_answer_list = []
         self.run_answer_wait_flag = "Waiting Multiprocessing.Pool Answer"
         self.default_error = '{"error_code": "-2"}'
-        self.finished = threading.Event()
         self.thread_num = args.num_process_evaluate
         self.multiprocess_num = args.num_process_evaluate
-        self.active_workers = 0
+        if getattr(args, "no_sandbox_pool", False):
+            self.sandbox_pool = None
+        else:
+            # fork the sandbox workers now, before any repair threads exist
+            self.sandbox_pool = get_sandbox_pool(
+                self.multiprocess_num,
+                getattr(args, "sandbox_max_jobs", 100),
+            )
+        # public tests of the same code are re-run by public_passes, get_metadata
+        # and repair_code; grade each (code, tests) pair once
+        self.eval_cache = get_eval_cache(args)
+        self.run_options = get_run_options(args)
+        self.prompt_scheduler = None
+        self.submit_prompt = None
+        self.exec_executor = None
+        self.stage_stats = StageStats()
+        self.progress = None
+        self.checkpoint = None
         self.testcase_generation_num = 0
         self.property_generation_num = 0
         self.no_public_tescase_num = 0
@@ -366,13 +387,15 @@ class MyPipeline:
             if output_path:
                 self.repair_trace_path = output_path.replace(".json", "_repair_trace.jsonl")
                 Path(self.repair_trace_path).parent.mkdir(parents=True, exist_ok=True)
-                Path(self.repair_trace_path).write_text("")
+                if not getattr(args, "resume_checkpoint", False):
+                    Path(self.repair_trace_path).write_text("")
         if getattr(args, "save_property_trace", False):
             output_path = getattr(args, "output_path", "")
             if output_path:
                 self.property_trace_path = output_path.replace(".json", "_property_trace.jsonl")
                 Path(self.property_trace_path).parent.mkdir(parents=True, exist_ok=True)
-                Path(self.property_trace_path).write_text("")
+                if not getattr(args, "resume_checkpoint", False):
+                    Path(self.property_trace_path).write_text("")
         self.public_direct_outputs = self.load_public_direct_outputs(
             getattr(args, "property_public_direct_outputs_path", "")
         )
@@ -462,16 +485,7 @@ class MyPipeline:
                 metadata,
             )
             
-            if self.thread_num == 1:
-                output = prompts_to_outputs([prompt])[0]
-            else:
-                # submit the request to the main thread and wait for it
-                event = threading.Event()
-                self.request_queue.put((worker_id, "prompts_to_code", prompt, event))
-                # print(f"worker {worker_id} queued prompts_to_code request and is waiting")
-                event.wait()  # wait for the main thread to process
-                # print(f"worker {worker_id} resumed")
-                output = self.prompts_answer_list[worker_id]
+            output = self.prompt_to_output(prompt, prompts_to_outputs)
             
             output_code = extract_func(output[0], model_style) if type(output) is list else extract_func(output, model_style)
             if extract_func is extract_code:
@@ -524,13 +538,7 @@ class MyPipeline:
                     variant=variant,
                 )
 
-                if self.thread_num == 1:
-                    output = prompts_to_outputs([prompt])[0]
-                else:
-                    event = threading.Event()
-                    self.request_queue.put((worker_id, "prompts_to_code", prompt, event))
-                    event.wait()
-                    output = self.prompts_answer_list[worker_id]
+                output = self.prompt_to_output(prompt, prompts_to_outputs)
 
                 raw = output[0] if isinstance(output, list) else output
                 extracted = extract_property_assertions(raw, model_style)
@@ -577,13 +585,7 @@ class MyPipeline:
                 {"metadata": metadata, "public_samples": samples},
                 proposals=unique,
             )
-            if self.thread_num == 1:
-                output = prompts_to_outputs([prompt])[0]
-            else:
-                event = threading.Event()
-                self.request_queue.put((worker_id, "prompts_to_code", prompt, event))
-                event.wait()
-                output = self.prompts_answer_list[worker_id]
+            output = self.prompt_to_output(prompt, prompts_to_outputs)
             raw = output[0] if isinstance(output, list) else output
             merged = []
             seen = set()
@@ -615,18 +617,32 @@ class MyPipeline:
         return unique
     
     
+    def prompt_to_output(self, prompt, prompts_to_outputs):
+        if self.thread_num == 1:
+            return prompts_to_outputs([prompt])[0]
+        if self.submit_prompt is not None:
+            # the runner keeps its own requests in flight; no batching needed
+            start = time.monotonic()
+            outputs = self.submit_prompt(prompt).result()
+            self.stage_stats.record("llm", time.monotonic() - start)
+            return outputs
+        # the scheduler batches this prompt with those of the other workers
+        # and wakes this thread as soon as its output is back
+        return self.prompt_scheduler.submit(prompt)
+
+
     def put_run_exec(self, worker_id, samples, output_code, timeout):
+        start = time.monotonic()
         if self.thread_num == 1:
-            curr_res, curr_metadata = run_exec(samples, output_code, timeout)
+            curr_res, curr_metadata = run_exec(samples, output_code, timeout, self.sandbox_pool, self.eval_cache, self.run_options)
         else:
-            # submit the execution request to the main thread and wait for it
-            event = threading.Event()
-            self.request_queue.put((worker_id, "run_exec", (samples, output_code, timeout), event))
-            # print(f"worker {worker_id} queued run_exec request and is waiting")
-            event.wait()  # wait for the main thread to process
-            # print(f"worker {worker_id} resumed")
-            global run_answer_list
-            curr_res, curr_metadata = run_answer_list[worker_id]
+            # run_exec/check_correctness hands the job to a sandbox worker process
+            # (or starts one without the pool), so a bounded thread pool is
+            # enough to dispatch it and wake this worker when it is done
+            curr_res, curr_metadata = self.exec_executor.submit(
+                run_exec, samples, output_code, timeout, self.sandbox_pool, self.eval_cache, self.run_options
+            ).result()
+        self.stage_stats.record("run_exec", time.monotonic() - start)
         return curr_res, curr_metadata
     
 
@@ -881,7 +897,7 @@ class MyPipeline:
                 {"metadata": metadata, "public_samples": samples},
             )
             property_samples = append_property_probe_inputs(samples, probe_inputs)
-            curr_res, curr_metadata = run_exec(property_samples, candidate, args.timeout)
+            curr_res, curr_metadata = run_exec(property_samples, candidate, args.timeout, self.sandbox_pool, self.eval_cache, self.run_options)
             error_code = metadata_error_code(curr_metadata)
             has_checker = "assert" in candidate or "raise" in candidate
             decision = "pending"
@@ -1063,7 +1079,7 @@ class MyPipeline:
                 "error_code": -4,
                 "error_message": "Could not instrument repaired candidate with accepted generated properties.",
             }, ""
-        curr_res, curr_metadata = run_exec(samples, instrumented, args.timeout)
+        curr_res, curr_metadata = run_exec(samples, instrumented, args.timeout, self.sandbox_pool, self.eval_cache, self.run_options)
         return curr_res, curr_metadata, instrumented
 
     def public_passes(self, worker_id, samples, code, metadata, args):
@@ -1553,222 +1569,168 @@ class MyPipeline:
                 "interface_ok": candidate_preserves_interface(repaired_code, metadata),
             })
             repaired_code = base_code
-        self.prompts_answer_list[worker_id] = repaired_code
-        self.active_workers -= 1
-        if self.active_workers == 0:
-            self.finished.set()
+        return repaired_code
+
+
+    def run_worker(self, outputs, problem_idx, code_idx, worker_args):
+        self.prompt_scheduler.worker_started()
+        start = time.monotonic()
+        try:
+            repaired_code = self.solve_one_problem(*worker_args)
+        except Exception:
+            # keep the original candidate rather than losing the whole run; it
+            # is not checkpointed, so a resumed run tries it again
+            traceback.print_exc()
+            outputs[problem_idx][code_idx] = "```\n" + worker_args[2] + "\n```"
+        else:
+            self.finish_candidate(outputs, problem_idx, code_idx, worker_args[6], repaired_code)
+        finally:
+            self.stage_stats.record("candidate", time.monotonic() - start)
+            self.prompt_scheduler.worker_finished()
+            self.progress.set_postfix_str(self.stage_stats.summary(), refresh=False)
+            self.progress.update(1)
+
+
+    def finish_candidate(self, outputs, problem_idx, code_idx, problem, repaired_code):
+        outputs[problem_idx][code_idx] = "```\n" + repaired_code + "\n```"
+        if self.checkpoint is not None:
+            self.checkpoint.append(problem.question_id, code_idx, outputs[problem_idx][code_idx])
 
 
     def get_train_data(self, worker_id, question_content, code, public_grade, metadata, platform, problem, model_style, args, prompts_to_outputs):
         pass
 
 
-    def our_method_pipeline(self, benchmark, model_style, args, check_metadata_list, prompts_to_outputs):
-        global run_answer_list
+    def our_method_pipeline(self, benchmark, model_style, args, check_metadata_list, prompts_to_outputs, submit_prompt=None):
         outputs = [
             [None for _ in range(args.codegen_n)]
             for _ in range(len(benchmark))
         ]
         
-        threads = []
         worker_id = 0
-        prompt_index_to_question_idx = []
-        prompt_index_to_code_idx = []
+        output_path = getattr(args, "output_path", "")
+        if output_path and not getattr(args, "no_candidate_checkpoint", False):
+            self.checkpoint = CandidateCheckpoint(
+                output_path.replace(".json", "_checkerextend.jsonl"),
+                resume=getattr(args, "resume_checkpoint", False),
+            )
+        if self.thread_num != 1:
+            self.submit_prompt = submit_prompt
+            self.prompt_scheduler = PromptScheduler(
+                prompts_to_outputs,
+                max_batch_size=getattr(args, "max_concurrency", 4),
+                max_wait_seconds=2.0,
+                stats=self.stage_stats,
+            )
+            self.exec_executor = ThreadPoolExecutor(max_workers=self.multiprocess_num)
+            # enough candidates in flight to fill an LLM batch while others
+            # wait on the sandboxes; further candidates queue until one finishes
+            num_workers = getattr(args, "checker_workers", 0) or (
+                getattr(args, "max_concurrency", 4) + self.multiprocess_num
+            )
+            worker_pool = ThreadPoolExecutor(max_workers=num_workers)
+            self.progress = tqdm(desc="checkerextend candidates", total=0)
         
         yes_num, no_num, strong_public_num = 0, 0, 0
         oracle_skip_full_pass_num = 0
+        checkpoint_resumed_num = 0
+        check_metadata_store = RecordStore(check_metadata_list)
         public_only_routing = getattr(args, "property_public_only_routing", False)
         oracle_skip_full_pass = (
             public_only_routing
             and getattr(args, "property_oracle_skip_full_pass", False)
         )
         for problem_idx, problem in tqdm(enumerate(benchmark)):
-            for check_metadata_idx, check_metadata in enumerate(check_metadata_list):
-                if problem.question_id == check_metadata['question_id']:
-                    question_content = check_metadata["question_content"]
-                    code_list = check_metadata["code_list"]
-                    output_list = check_metadata["output_list"]
-                    graded_list = check_metadata["graded_list"]
-                    public_graded_list = check_metadata["public_graded_list"]
-                    platform = check_metadata["platform"]
-                    metadata = check_metadata["metadata"]
-
-                    for code_idx in range(len(code_list)):
-                        public_grade = public_graded_list[code_idx]
-                        if public_only_routing:
-                            if public_grade:
-                                yes_num += 1
-                            else:
-                                no_num += 1
-                                strong_public_num += 1
-                            if oracle_skip_full_pass and graded_list[code_idx]:
-                                oracle_skip_full_pass_num += 1
-                                outputs[problem_idx][code_idx] = output_list[code_idx]
-                                continue
-                        elif graded_list[code_idx]:
+            for check_metadata in check_metadata_store.matches(problem.question_id):
+                question_content = check_metadata["question_content"]
+                code_list = check_metadata["code_list"]
+                output_list = check_metadata["output_list"]
+                graded_list = check_metadata["graded_list"]
+                public_graded_list = check_metadata["public_graded_list"]
+                platform = check_metadata["platform"]
+                metadata = check_metadata["metadata"]
+
+                for code_idx in range(len(code_list)):
+                    public_grade = public_graded_list[code_idx]
+                    if public_only_routing:
+                        if public_grade:
                             yes_num += 1
-                            outputs[problem_idx][code_idx] = output_list[code_idx]
-                            continue
                         else:
                             no_num += 1
-                        if not public_only_routing and public_grade == False:
                             strong_public_num += 1
+                        if oracle_skip_full_pass and graded_list[code_idx]:
+                            oracle_skip_full_pass_num += 1
+                            outputs[problem_idx][code_idx] = output_list[code_idx]
+                            continue
+                    elif graded_list[code_idx]:
+                        yes_num += 1
+                        outputs[problem_idx][code_idx] = output_list[code_idx]
+                        continue
+                    else:
+                        no_num += 1
+                    if not public_only_routing and public_grade == False:
+                        strong_public_num += 1
                         
-                        if self.thread_num == 1:
-                            self.prompts_answer_list.append("")
-                            run_answer_list.append("")
-                            self.solve_one_problem(
-                                worker_id,
-                                question_content,
-                                code_list[code_idx],
-                                public_grade,
-                                metadata[code_idx],
-                                platform,
-                                problem,
-                                model_style,
-                                args,
-                                prompts_to_outputs,
-                            )
-                            outputs[problem_idx][code_idx] = self.prompts_answer_list[worker_id]
-                            outputs[problem_idx][code_idx] = "```\n" + outputs[problem_idx][code_idx] + "\n```"
-                            worker_id += 1
-                        else:
-                            t = threading.Thread(
-                                target=self.solve_one_problem, 
-                                args=(
-                                    worker_id,
-                                    question_content,
-                                    code_list[code_idx],
-                                    public_grade,
-                                    metadata[code_idx],
-                                    platform,
-                                    problem,
-                                    model_style,
-                                    args,
-                                    prompts_to_outputs,
-                                )
-                            )
-                            worker_id += 1
-                            self.prompts_answer_list.append("")
-                            run_answer_list.append("")
-                            prompt_index_to_question_idx.append(problem_idx)
-                            prompt_index_to_code_idx.append(code_idx)
-                            self.active_workers += 1
-                            threads.append(t)
-                            t.start()
+                    if self.checkpoint is not None:
+                        checkpointed = self.checkpoint.get(problem.question_id, code_idx)
+                        if checkpointed is not None:
+                            checkpoint_resumed_num += 1
+                            outputs[problem_idx][code_idx] = checkpointed
+                            continue
+                        
+                    if self.thread_num == 1:
+                        repaired_code = self.solve_one_problem(
+                            worker_id,
+                            question_content,
+                            code_list[code_idx],
+                            public_grade,
+                            metadata[code_idx],
+                            platform,
+                            problem,
+                            model_style,
+                            args,
+                            prompts_to_outputs,
+                        )
+                        self.finish_candidate(outputs, problem_idx, code_idx, problem, repaired_code)
+                        worker_id += 1
+                    else:
+                        worker_args = (
+                            worker_id,
+                            question_content,
+                            code_list[code_idx],
+                            public_grade,
+                            metadata[code_idx],
+                            platform,
+                            problem,
+                            model_style,
+                            args,
+                            prompts_to_outputs,
+                        )
+                        worker_id += 1
+                        self.prompt_scheduler.job_submitted()
+                        self.progress.total += 1
+                        worker_pool.submit(
+                            self.run_worker, outputs, problem_idx, code_idx, worker_args
+                        )
                             
         print(
             "yes_num=", yes_num,
             "no_num=", no_num,
             "strong_public_num=", strong_public_num,
             "oracle_skip_full_pass_num=", oracle_skip_full_pass_num,
+            "checkpoint_resumed_num=", checkpoint_resumed_num,
         )
         
         if self.thread_num != 1:
-            pool = None
-            prompts = []
-            prompt_events = []
-            prompts_worker_id = []
-            prompt_first_enqueue_at = None
-            run_exec_events = []
-            run_exec_worker_id = []
-            prompt_batch_size = max(1, int(getattr(args, "max_concurrency", 4)))
-            prompt_flush_seconds = 2.0
-
-            def run_exec_in_thread(worker_id, data, event):
-                run_answer_list[worker_id] = run_exec(data[0], data[1], data[2])
-                event.set()
-
-            def flush_pending_prompts(reason):
-                nonlocal prompts, prompt_events, prompts_worker_id, prompt_first_enqueue_at
-                if not prompts:
-                    return
-                print(f"\nflushing {len(prompts)} LLM prompts ({reason})")
-                try:
-                    tmp_outputs = prompts_to_outputs(prompts)
-                except Exception as exc:
-                    print(f"LLM batch failed, resuming workers with empty outputs: {exc}")
-                    tmp_outputs = [[""] for _ in prompts]
-                for i, worker_id in enumerate(prompts_worker_id):
-                    if i < len(tmp_outputs):
-                        self.prompts_answer_list[worker_id] = tmp_outputs[i]
-                    else:
-                        self.prompts_answer_list[worker_id] = [""]
-                for event in prompt_events:
-                    event.set()
-                prompts = []
-                prompt_events = []
-                prompts_worker_id = []
-                prompt_first_enqueue_at = None
-            
-            while not self.finished.is_set():
-                try:
-                    # non-blocking get with up to 1 second timeout
-                    worker_id, event_type, data, event = self.request_queue.get(timeout=1)
-                    # print(f"\nmain thread handling request from worker {worker_id}: {event_type}")
-                    if event_type == "prompts_to_code":
-                        # print(f"main thread finished prompt preprocessing for worker {worker_id}")
-                        prompts.append(data)
-                        prompt_events.append(event)
-                        prompts_worker_id.append(worker_id)
-                        if prompt_first_enqueue_at is None:
-                            prompt_first_enqueue_at = time.time()
-                        self.request_queue.task_done()
-                    elif event_type == "run_exec":
-                        # run_exec/check_correctness already creates child processes
-                        # for isolation and timeout handling. Running it inside a
-                        # multiprocessing.Pool daemon causes "daemonic processes are
-                        # not allowed to have children", so dispatch it from a
-                        # regular thread in the main process instead.
-                        run_answer_list[worker_id] = self.run_answer_wait_flag
-                        threading.Thread(
-                            target=run_exec_in_thread,
-                            args=(worker_id, data, event),
-                            daemon=True,
-                        ).start()
-                        self.request_queue.task_done()
-                    else:
-                        # print("main thread has no pending tasks")
-                        pass
-                except Empty:
-                    # queue is empty
-                    # print("main thread has no pending tasks")
-                    if self.active_workers == 0:
-                        break
-
-                new_run_exec_events = []
-                new_run_exec_worker_id = []
-                for i in range(len(run_exec_worker_id)):
-                    tmp_worker_id = run_exec_worker_id[i]
-                    if run_answer_list[tmp_worker_id] == self.run_answer_wait_flag:
-                        new_run_exec_worker_id.append(run_exec_worker_id[i])
-                        new_run_exec_events.append(run_exec_events[i])
-                    else:
-                        run_exec_events[i].set()
-                run_exec_events = []
-                run_exec_worker_id = []
-                for i in range(len(new_run_exec_worker_id)):
-                    run_exec_events.append(new_run_exec_events[i])
-                    run_exec_worker_id.append(new_run_exec_worker_id[i])
-
-                if prompts:
-                    waited = time.time() - prompt_first_enqueue_at if prompt_first_enqueue_at else 0.0
-                    if len(prompts) >= prompt_batch_size:
-                        flush_pending_prompts("batch_size")
-                    elif self.active_workers == len(prompts):
-                        flush_pending_prompts("all_active_workers_waiting")
-                    elif waited >= prompt_flush_seconds:
-                        flush_pending_prompts("flush_interval")
-                
-            if pool is not None:
-                pool.close()
-                pool.join()
-            flush_pending_prompts("shutdown")
-            
-            for prompt_idx, output in enumerate(self.prompts_answer_list):
-                question_idx = prompt_index_to_question_idx[prompt_idx]
-                code_idx = prompt_index_to_code_idx[prompt_idx]
-                outputs[question_idx][code_idx] = "```\n" + output + "\n```"
+            # sleeps until a worker submits a prompt or finishes; returns once
+            # every submitted candidate is done
+            self.prompt_scheduler.run()
+            worker_pool.shutdown()
+            self.exec_executor.shutdown()
+            self.progress.close()
+            print("checkerextend throughput:", self.stage_stats.summary())
+        if self.checkpoint is not None:
+            self.checkpoint.finalize()
         
         print(
             "testcase_inputer_generation_num=",
@@ -104,12 +104,35 @@ def get_args():
     )
     parser.add_argument("--continue_existing", action="store_true")
     parser.add_argument("--continue_existing_with_eval", action="store_true")
+    parser.add_argument(
+        "--resume_checkpoint",
+        action="store_true",
+        help=(
+            "For checkerextend, skip candidates already recorded in the "
+            "<output>_checkerextend.jsonl(.partial) checkpoint of an earlier run."
+        ),
+    )
+    parser.add_argument(
+        "--no_candidate_checkpoint",
+        action="store_true",
+        help="Do not append finished checkerextend candidates to a JSONL checkpoint.",
+    )
     parser.add_argument(
         "--use_cache", action="store_true", help="Use cache for generation"
     )
     parser.add_argument(
         "--cache_batch_size", type=int, default=100, help="Batch size for caching"
     )
+    parser.add_argument(
+        "--cache_compress",
+        action="store_true",
+        help="zstd-compress new responses in the response cache (needs the zstandard package)",
+    )
+    parser.add_argument(
+        "--compact_cache",
+        action="store_true",
+        help="Drop superseded records from the response cache before running",
+    )
     parser.add_argument("--debug", action="store_true", help="Debug mode")
     parser.add_argument(
         "--debug_size",
@@ -136,6 +159,75 @@ def get_args():
         help="Number of processes to use for evaluation",
     )
     parser.add_argument("--timeout", type=int, default=6, help="Timeout for evaluation")
+    parser.add_argument(
+        "--no_sandbox_pool",
+        action="store_true",
+        help="Start a fresh process per evaluated candidate instead of reusing long-lived sandbox workers.",
+    )
+    parser.add_argument(
+        "--sandbox_max_jobs",
+        type=int,
+        default=100,
+        help="Recycle a sandbox worker after this many evaluated candidates (0 means never).",
+    )
+    parser.add_argument(
+        "--eval_test_shards",
+        type=int,
+        default=1,
+        help=(
+            "Split each problem's tests across this many sandbox workers during "
+            "evaluation and stop at the first failing test. Requires the sandbox pool."
+        ),
+    )
+    parser.add_argument(
+        "--cpu_timeout",
+        type=float,
+        default=None,
+        help=(
+            "Limit every test to this many seconds of CPU time (fractions allowed) "
+            "instead of --timeout seconds of wall-clock time, so evaluation can use "
+            "every core without load-dependent timeouts. The wall-clock limit becomes "
+            "max(--timeout, 2 * cpu_timeout + 1)."
+        ),
+    )
+    parser.add_argument(
+        "--memory_limit_mb",
+        type=int,
+        default=0,
+        help=(
+            "Let the sandbox process running each candidate map at most this many MiB on top "
+            "of what it maps already; running out is graded as Memory Limit Exceeded. "
+            "0 (default) disables the limit."
+        ),
+    )
+    parser.add_argument(
+        "--stdio_engine",
+        type=str,
+        default="patch",
+        choices=["patch", "fork"],
+        help=(
+            "How stdin/stdout programs are graded: 'patch' calls them in the sandbox "
+            "worker with mocked stdin/stdout, 'fork' runs every test in a forked child "
+            "on real pipes with a CPU-time limit (--cpu_timeout, or --timeout)."
+        ),
+    )
+    parser.add_argument(
+        "--no_eval_cache",
+        action="store_true",
+        help="Always execute candidates instead of reusing cached run_test results.",
+    )
+    parser.add_argument(
+        "--eval_cache_path",
+        type=str,
+        default="cache/eval_results.sqlite",
+        help="SQLite file holding cached run_test results, keyed by code, tests, timeout and evaluator version.",
+    )
+    parser.add_argument(
+        "--eval_cache_max_mb",
+        type=int,
+        default=2048,
+        help="Evict least recently used cached run_test results beyond this size.",
+    )
     parser.add_argument(
         "--openai_timeout", type=int, default=90, help="Timeout for requests to OpenAI"
     )
@@ -179,6 +271,50 @@ def get_args():
         default=8,
         help="Maximum concurrent requests for OpenAI-compatible local/API runners.",
     )
+    parser.add_argument(
+        "--adaptive_concurrency",
+        action="store_true",
+        help=(
+            "Let API runners raise their concurrency above max_concurrency (multiprocess for OpenAI) "
+            "while requests succeed with healthy latency, and halve it on 429/5xx/timeouts."
+        ),
+    )
+    parser.add_argument(
+        "--max_adaptive_concurrency",
+        type=int,
+        default=0,
+        help="Upper bound for --adaptive_concurrency. Defaults to 4x the starting concurrency.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions from OpenAI-compatible local runners (needed for --stream_stop).",
+    )
+    parser.add_argument(
+        "--stream_stop",
+        type=str,
+        default=None,
+        choices=["code_block", "json"],
+        help=(
+            "With --stream, cancel a completion once it has moved past a closed ```python block "
+            "(code_block) or closed a JSON array/object (json); the text after it is never generated."
+        ),
+    )
+    parser.add_argument(
+        "--stream_timeout",
+        type=float,
+        default=None,
+        help="With --stream, return the text generated so far after this many seconds.",
+    )
+    parser.add_argument(
+        "--checker_workers",
+        type=int,
+        default=0,
+        help=(
+            "Number of failing candidates checkerextend works on at once. "
+            "Defaults to max_concurrency + num_process_evaluate."
+        ),
+    )
     parser.add_argument(
         "--checker_mode",
         type=str,
@@ -381,6 +517,14 @@ def get_args():
         default=None,
         help="End date for the contest to filter the evaluation file (format - YYYY-MM-DD)",
     )
+    parser.add_argument(
+        "--platforms",
+        type=str,
+        nargs="+",
+        default=None,
+        choices=["leetcode", "codeforces", "atcoder", "humaneval"],
+        help="Only load codegeneration problems from these platforms",
+    )
 
     args = parser.parse_args()
 
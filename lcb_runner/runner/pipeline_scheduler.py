@@ -0,0 +1,145 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class PromptScheduler:
+    """Batches LLM prompts from checkerextend worker threads.
+
+    Every candidate is announced with `job_submitted`; the worker running it
+    calls `worker_started` and `worker_finished` around it. Workers call
+    `submit`, which blocks until the prompt's output is ready. The thread
+    running `run` sleeps on a condition variable and is woken by every new
+    prompt and every finished worker; it flushes the pending prompts as one
+    `prompts_to_outputs` call as soon as
+      - `max_batch_size` prompts are pending,
+      - every running worker is waiting for a prompt (nothing else can arrive), or
+      - the oldest prompt has waited for the flush window.
+    The flush window is a fraction of the recent batch latency, capped by
+    `max_wait_seconds`: waiting for more prompts is only worth it when a batch
+    is slow compared to the wait.
+    """
+
+    def __init__(
+        self,
+        prompts_to_outputs,
+        max_batch_size,
+        max_wait_seconds=2.0,
+        latency_fraction=0.1,
+        stats=None,
+    ):
+        self.prompts_to_outputs = prompts_to_outputs
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_seconds = max_wait_seconds
+        self.latency_fraction = latency_fraction
+        self.stats = stats
+        self._cond = threading.Condition()
+        self._pending = []
+        self._first_enqueue_at = None
+        self._running_workers = 0
+        self._unfinished_jobs = 0
+        self._latency_ema = None
+
+    def job_submitted(self):
+        with self._cond:
+            self._unfinished_jobs += 1
+
+    def worker_started(self):
+        with self._cond:
+            self._running_workers += 1
+
+    def worker_finished(self):
+        with self._cond:
+            self._running_workers -= 1
+            self._unfinished_jobs -= 1
+            self._cond.notify()
+
+    def submit(self, prompt):
+        future = Future()
+        with self._cond:
+            if not self._pending:
+                self._first_enqueue_at = time.monotonic()
+            self._pending.append((prompt, future))
+            self._cond.notify()
+        return future.result()
+
+    def flush_window(self):
+        if self._latency_ema is None:
+            return self.max_wait_seconds
+        return min(self.max_wait_seconds, self.latency_fraction * self._latency_ema)
+
+    def _flush_reason(self):
+        """Return `(reason, seconds_to_wait)`; `reason` is None if not flushing yet."""
+        if not self._pending:
+            return None, None
+        if len(self._pending) >= self.max_batch_size:
+            return "batch_size", None
+        if len(self._pending) >= self._running_workers:
+            return "all_active_workers_waiting", None
+        waited = time.monotonic() - self._first_enqueue_at
+        window = self.flush_window()
+        if waited >= window:
+            return "flush_interval", None
+        return None, window - waited
+
+    def run(self):
+        """Dispatch prompt batches until every submitted job has finished."""
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending and self._unfinished_jobs <= 0:
+                        return
+                    reason, wait = self._flush_reason()
+                    if reason is not None:
+                        break
+                    self._cond.wait(wait)
+                batch, self._pending = self._pending, []
+                self._first_enqueue_at = None
+            self._flush(batch, reason)
+
+    def _flush(self, batch, reason):
+        print(f"\nflushing {len(batch)} LLM prompts ({reason})")
+        start = time.monotonic()
+        try:
+            outputs = self.prompts_to_outputs([prompt for prompt, _ in batch])
+        except Exception as exc:
+            print(f"LLM batch failed, resuming workers with empty outputs: {exc}")
+            outputs = [[""] for _ in batch]
+        latency = time.monotonic() - start
+        if self._latency_ema is None:
+            self._latency_ema = latency
+        else:
+            self._latency_ema = 0.7 * self._latency_ema + 0.3 * latency
+        if self.stats is not None:
+            self.stats.record("llm", latency, count=len(batch))
+        for i, (_, future) in enumerate(batch):
+            future.set_result(outputs[i] if i < len(outputs) else [""])
+
+
+class StageStats:
+    """Thread-safe per-stage counters for progress reporting.
+
+    `record(stage, seconds, count)` adds `count` items that kept the stage busy
+    for `seconds`; `summary` reports items per second of wall-clock time since
+    the stats were created, per stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._counts = {}
+        self._seconds = {}
+
+    def record(self, stage, seconds, count=1):
+        with self._lock:
+            self._counts[stage] = self._counts.get(stage, 0) + count
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+
+    def summary(self):
+        with self._lock:
+            elapsed = max(time.monotonic() - self._start, 1e-9)
+            return ", ".join(
+                f"{stage}={count} ({count / elapsed:.2f}/s, avg {self._seconds[stage] / count:.2f}s)"
+                for stage, count in self._counts.items()
+                if count
+            )
@@ -0,0 +1,197 @@
+"""Append-only, sharded store for LLM responses.
+
+`BaseRunner` used to keep every response in one JSON dict keyed by the full
+prompt text and rewrote the whole file after each batch. `ResponseCache`
+instead appends one `<key>\\t<payload>` line per response to one of
+`num_shards` files under a directory. The key is a sha256 of the sampling
+parameters and the prompt, so prompts are never stored, and the payload is
+the JSON list of outputs, optionally zstd compressed.
+
+Only the byte offset of each record is held in memory, so a lookup is a dict
+probe plus one read. Records are appended with a single `O_APPEND` write, so
+several runs can share a cache directory; a miss re-scans the tail of its
+shard to pick up records appended by other processes. Later records win,
+and `compact` rewrites the shards without the superseded ones.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def prompt_cache_key(prompt) -> str:
+    if isinstance(prompt, list):
+        return json.dumps(prompt)
+    if isinstance(prompt, tuple):
+        return prompt[0] + json.dumps(prompt[1])
+    return prompt
+
+
+class ResponseCache:
+    def __init__(self, path: str, params: dict | None = None, num_shards: int = 16, compress: bool = False):
+        if compress and zstandard is None:
+            raise ImportError("compressing the response cache requires the zstandard package")
+        self.path = path
+        self.params_json = json.dumps(params or {}, sort_keys=True)
+        self.num_shards = num_shards
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._index = {}  # key -> (shard, offset, length)
+        self._scanned = [0 for _ in range(num_shards)]
+        self._pending = {}  # key -> outputs not yet written by `flush`
+        self._superseded = 0
+        os.makedirs(path, exist_ok=True)
+        for shard in range(num_shards):
+            self._scan(shard)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index) + sum(1 for key in self._pending if key not in self._index)
+
+    def key(self, prompt) -> str:
+        text = self.params_json + "\n" + prompt_cache_key(prompt)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _shard_of(self, key: str) -> int:
+        return int(key[:8], 16) % self.num_shards
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.path, f"shard_{shard:02d}.jsonl")
+
+    def _scan(self, shard):
+        """Index the records appended to `shard` since the last scan. Call with the lock held."""
+        path = self._shard_path(shard)
+        if not os.path.exists(path) or os.path.getsize(path) <= self._scanned[shard]:
+            return
+        offset = self._scanned[shard]
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # a write still in progress in another process
+                    break
+                key, sep, _ = line.partition(b"\t")
+                if sep:
+                    key = key.decode("utf-8", errors="replace")
+                    if key in self._index:
+                        self._superseded += 1
+                    self._index[key] = (shard, offset, len(line))
+                offset += len(line)
+        self._scanned[shard] = offset
+
+    def _encode(self, key, outputs) -> bytes:
+        payload = json.dumps(outputs)
+        if self.compress:
+            compressed = zstandard.ZstdCompressor().compress(payload.encode("utf-8"))
+            payload = "z" + base64.b64encode(compressed).decode("ascii")
+        return f"{key}\t{payload}\n".encode("utf-8")
+
+    @staticmethod
+    def _decode(line: bytes):
+        payload = line.partition(b"\t")[2].rstrip(b"\n")
+        if payload.startswith(b"z"):
+            if zstandard is None:
+                raise ImportError("reading a compressed response cache requires the zstandard package")
+            payload = zstandard.ZstdDecompressor().decompress(base64.b64decode(payload[1:]))
+        return json.loads(payload)
+
+    def get(self, prompt):
+        """Return the cached outputs for `prompt`, or None."""
+        key = self.key(prompt)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            location = self._index.get(key)
+            if location is None:
+                self._scan(self._shard_of(key))
+                location = self._index.get(key)
+        for _ in range(2):
+            if location is None:
+                return None
+            shard, offset, length = location
+            try:
+                with open(self._shard_path(shard), "rb") as f:
+                    f.seek(offset)
+                    line = f.read(length)
+                if line.startswith(key.encode("ascii") + b"\t"):
+                    return self._decode(line)
+            except (OSError, ValueError):
+                pass
+            # the shard was compacted by another process; re-index it
+            with self._lock:
+                self._index = {k: v for k, v in self._index.items() if v[0] != shard}
+                self._scanned[shard] = 0
+                self._scan(shard)
+                location = self._index.get(key)
+        return None
+
+    def put(self, prompt, outputs):
+        """Record `outputs` for `prompt`; it is written to disk by the next `flush`."""
+        key = self.key(prompt)
+        with self._lock:
+            self._pending[key] = outputs
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            lines = [[] for _ in range(self.num_shards)]
+            for key, outputs in pending.items():
+                lines[self._shard_of(key)].append(self._encode(key, outputs))
+            for shard, shard_lines in enumerate(lines):
+                if not shard_lines:
+                    continue
+                data = b"".join(shard_lines)
+                fd = os.open(self._shard_path(shard), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    while data:
+                        data = data[os.write(fd, data):]
+                finally:
+                    os.close(fd)
+                self._scan(shard)
+
+    def compact(self):
+        """Rewrite every shard without superseded records.
+
+        Records appended by another process while this runs may be lost, so
+        only compact a cache that no other run is writing to.
+        """
+        self.flush()
+        with self._lock:
+            for shard in range(self.num_shards):
+                self._scan(shard)
+            if not self._superseded:
+                return
+            live = [[] for _ in range(self.num_shards)]
+            for shard, offset, length in self._index.values():
+                live[shard].append((offset, length))
+            for shard, records in enumerate(live):
+                path = self._shard_path(shard)
+                if not os.path.exists(path):
+                    continue
+                tmp_path = path + ".tmp"
+                with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+                    for offset, length in sorted(records):
+                        src.seek(offset)
+                        dst.write(src.read(length))
+                os.replace(tmp_path, path)
+            self._index = {}
+            self._scanned = [0 for _ in range(self.num_shards)]
+            self._superseded = 0
+            for shard in range(self.num_shards):
+                self._scan(shard)
@@ -19,7 +19,7 @@ def main():
         data = json.load(f)
     metadatas = data[2]
 
-    ans = [0] * 6
+    ans = [0] * 7
     ac = 0
     for prob_metadata in metadatas:
         for metadata in prob_metadata:
@@ -36,6 +36,7 @@ def main():
     print("TLE  ", ans[3], normalized[3])
     print("RE   ", ans[4], normalized[4])
     print("CE   ", ans[1], normalized[1])
+    print("MLE  ", ans[6], normalized[6])
     print("Other", ans[5], normalized[5])
     
     
@@ -1,13 +1,16 @@
 from typing import Union
+import copy
 import json
 
 from lcb_runner.utils.scenarios import Scenario, TestCaseForRepair
+from lcb_runner.utils.record_store import RecordStore
 from lcb_runner.lm_styles import LanguageModel
 from lcb_runner.evaluation import (
     codegen_metrics,
     test_output_metrics,
     code_execution_metrics,
 )
+from lcb_runner.evaluation.result_cache import open_eval_cache
 
 from lcb_runner.prompts import (
     format_prompt_generation,
@@ -41,7 +44,7 @@ BenchMarkType = list[
 ]
 
 
-def build_prompt_benchmark(
+def _load_prompt_benchmark(
     args,
 ) -> tuple[
     list[CodeExecutionProblem]
@@ -59,7 +62,8 @@ def build_prompt_benchmark(
             benchmark = load_code_generation_dataset(
                 args.release_version,
                 start_date=args.start_date,
-                end_date=args.end_date
+                end_date=args.end_date,
+                platforms=getattr(args, "platforms", None),
             )
         benchmark = sorted(benchmark, key=lambda x: x.question_id)
         format_prompt = format_prompt_generation
@@ -92,6 +96,65 @@ def build_prompt_benchmark(
     return benchmark, format_prompt
 
 
+class BenchmarkHandle:
+    """A benchmark loaded once per process.
+
+    `view` hands out a new list of shallow problem copies with their own
+    test lists and metadata, so a stage that overlays `extra_test` or
+    releases private tests does not affect the other stages.
+    """
+
+    def __init__(self, problems: BenchMarkType, format_prompt: callable):
+        self.problems = problems
+        self.format_prompt = format_prompt
+
+    @staticmethod
+    def _copy_problem(problem):
+        view = copy.copy(problem)
+        for attr in ("public_test_cases", "extra_test"):
+            value = getattr(view, attr, None)
+            if isinstance(value, list):
+                setattr(view, attr, list(value))
+        if isinstance(getattr(view, "metadata", None), dict):
+            view.metadata = dict(view.metadata)
+        return view
+
+    def view(self) -> BenchMarkType:
+        return [self._copy_problem(problem) for problem in self.problems]
+
+
+_benchmark_handles = {}
+
+
+def get_benchmark_handle(args) -> BenchmarkHandle:
+    key = (
+        args.scenario,
+        str(args.release_version),
+        getattr(args, "not_fast", False),
+        getattr(args, "start_date", None),
+        getattr(args, "end_date", None),
+        tuple(getattr(args, "platforms", None) or ()),
+        getattr(args, "cot_code_execution", False),
+    )
+    handle = _benchmark_handles.get(key)
+    if handle is None:
+        handle = _benchmark_handles[key] = BenchmarkHandle(*_load_prompt_benchmark(args))
+    return handle
+
+
+def build_prompt_benchmark(
+    args,
+) -> tuple[
+    list[CodeExecutionProblem]
+    | list[CodeGenerationProblem]
+    | list[TestOutputPredictionProblem],
+    callable,
+]:
+    # main.py asks for the benchmark in several stages; only the first call loads it
+    handle = get_benchmark_handle(args)
+    return handle.view(), handle.format_prompt
+
+
 def combine_results(
     scenario: Scenario,
     results: list[list[str]],
@@ -236,6 +299,34 @@ def sort_and_extract_save_results(scenario: Scenario, save_results: list[dict]):
     return save_results, combined_results
 
 
+def get_eval_cache(args):
+    if getattr(args, "no_eval_cache", False):
+        return None
+    return open_eval_cache(
+        getattr(args, "eval_cache_path", "cache/eval_results.sqlite"),
+        getattr(args, "eval_cache_max_mb", 2048) * 1024 * 1024,
+    )
+
+
+def get_run_options(args) -> dict:
+    """Extra `run_test` keyword arguments selected on the command line.
+
+    Only non-default values are included, so they also serve as part of the
+    `EvalResultCache` key without invalidating results graded before.
+    """
+    run_options = {}
+    stdio_engine = getattr(args, "stdio_engine", "patch")
+    if stdio_engine != "patch":
+        run_options["stdio_engine"] = stdio_engine
+    cpu_timeout = getattr(args, "cpu_timeout", None)
+    if cpu_timeout is not None:
+        run_options["cpu_timeout"] = cpu_timeout
+    memory_limit_mb = getattr(args, "memory_limit_mb", 0)
+    if memory_limit_mb:
+        run_options["memory_limit_mb"] = memory_limit_mb
+    return run_options
+
+
 def get_metrics(
     scenario: Scenario,
     args,
@@ -245,6 +336,10 @@ def get_metrics(
     combined_results,
 ):
     eval_samples = [instance.get_evaluation_sample() for instance in benchmark]
+    for instance in benchmark:
+        # the samples hold their own copy of the tests
+        if isinstance(instance, CodeGenerationProblem):
+            instance.release_private_tests()
     generations = [extracted for _, extracted in combined_results]
 
     if scenario == Scenario.codegeneration or scenario == Scenario.selfrepair or scenario == Scenario.testcasegeneration or scenario == Scenario.checkerextend:
@@ -253,6 +348,11 @@ def get_metrics(
             generations,
             num_process_evaluate=args.num_process_evaluate,
             timeout=args.timeout,
+            use_sandbox_pool=not getattr(args, "no_sandbox_pool", False),
+            sandbox_max_jobs=getattr(args, "sandbox_max_jobs", 100),
+            test_shards=getattr(args, "eval_test_shards", 1),
+            eval_cache=get_eval_cache(args),
+            run_options=get_run_options(args),
         )
 
     elif args.scenario == Scenario.testoutputprediction:
@@ -307,6 +407,7 @@ def check_testtype(testtype, platform):
 def get_public_sample_results(check_detail_list: list, check_outline_list: list, benchmark: list, save_results: list, codegen_results: list):
     check_outline_dict = check_outline_list[1]
     total_num, only_public_total, error_num = 0, 0, 0
+    save_results_store = RecordStore(save_results)
     for idx in range(len(benchmark)):
         public_test_cases_len = len(benchmark[idx].public_test_cases) + len(benchmark[idx].extra_test)
         public_test_cases_result = []
@@ -338,12 +439,11 @@ def get_public_sample_results(check_detail_list: list, check_outline_list: list,
         check_detail_list[idx]["public_graded_list"] = public_test_cases_result
         check_detail_list[idx]["only_public_graded_list"] = only_public_test_cases_result
         if "extra_test" in check_detail_list[idx].keys():
-            for save_detail_idx, save_detail in enumerate(save_results):
-                if check_detail_list[idx]['question_id'] == save_detail['question_id']:
-                    if "extra_test" in save_detail.keys():
-                        check_detail_list[idx]['extra_test'] = save_detail['extra_test']
-                    else:
-                        check_detail_list[idx]['extra_test'] = []
+            for save_detail in save_results_store.matches(check_detail_list[idx]['question_id']):
+                if "extra_test" in save_detail.keys():
+                    check_detail_list[idx]['extra_test'] = save_detail['extra_test']
+                else:
+                    check_detail_list[idx]['extra_test'] = []
     try:
         check_outline_list[0]["public_pass@1"] = total_num/len(benchmark)
         check_outline_list[0]["only_public_pass@1"] = only_public_total/len(benchmark)
@@ -357,41 +457,40 @@ def get_public_sample_results(check_detail_list: list, check_outline_list: list,
 
 def add_extra_samples(save_detail_list: list, check_metadata_list: list, benchmark: list):
     num, tmp = 0, 0
+    save_detail_store = RecordStore(save_detail_list)
     for idx in range(len(check_metadata_list)):
-        for save_detail_idx, save_detail in enumerate(save_detail_list):
-            if check_metadata_list[idx]['question_id'] == save_detail['question_id']:
-                if "extra_test" not in save_detail.keys() or len(save_detail['extra_test']) == 0:
-                    extra_test_key = "code_list"
-                else:
-                    extra_test_key = "extra_test"
-                check_metadata_list[idx]['extra_test'] = []
-                for extra_test_list in save_detail[extra_test_key]:
-                    if type(extra_test_list) is list and len(extra_test_list)>=1:
-                        check_metadata_list[idx]['extra_test'] += extra_test_list
-                        num += 1
-                    elif type(extra_test_list) is dict and "input" in extra_test_list.keys():
-                        check_metadata_list[idx]['extra_test'] += save_detail[extra_test_key]
-                        num += 1
-                        break
-                check_metadata_list[idx]['extra_test'] = [t for t in check_metadata_list[idx]['extra_test'] if check_testtype(t['testtype'], check_metadata_list[idx]['platform'])]
+        for save_detail in save_detail_store.matches(check_metadata_list[idx]['question_id']):
+            if "extra_test" not in save_detail.keys() or len(save_detail['extra_test']) == 0:
+                extra_test_key = "code_list"
+            else:
+                extra_test_key = "extra_test"
+            check_metadata_list[idx]['extra_test'] = []
+            for extra_test_list in save_detail[extra_test_key]:
+                if type(extra_test_list) is list and len(extra_test_list)>=1:
+                    check_metadata_list[idx]['extra_test'] += extra_test_list
+                    num += 1
+                elif type(extra_test_list) is dict and "input" in extra_test_list.keys():
+                    check_metadata_list[idx]['extra_test'] += save_detail[extra_test_key]
+                    num += 1
+                    break
+            check_metadata_list[idx]['extra_test'] = [t for t in check_metadata_list[idx]['extra_test'] if check_testtype(t['testtype'], check_metadata_list[idx]['platform'])]
     print(f"{num} problems add extra_test")
     from lcb_runner.benchmarks.code_generation import Test
     for idx in range(len(benchmark)):
-        for save_detail_idx, save_detail in enumerate(save_detail_list):
-            if benchmark[idx].question_id == save_detail['question_id']:
-                if "extra_test" not in save_detail.keys() or len(save_detail['extra_test']) == 0:
-                    extra_test_key = "code_list"
-                else:
-                    extra_test_key = "extra_test"
-                benchmark[idx].extra_test = []
-                for extra_test_list in save_detail[extra_test_key]:
-                    if type(extra_test_list) is list and len(extra_test_list)>=1:
-                        benchmark[idx].extra_test += [Test(**i) for i in extra_test_list]
-                        tmp += 1
-                    elif type(extra_test_list) is dict and "input" in extra_test_list.keys():
-                        benchmark[idx].extra_test += [Test(**i) for i in save_detail[extra_test_key]]
-                        tmp += 1
-                        break
-                benchmark[idx].extra_test = [t for t in benchmark[idx].extra_test if check_testtype(t.testtype, benchmark[idx].platform)]
+        for save_detail in save_detail_store.matches(benchmark[idx].question_id):
+            if "extra_test" not in save_detail.keys() or len(save_detail['extra_test']) == 0:
+                extra_test_key = "code_list"
+            else:
+                extra_test_key = "extra_test"
+            benchmark[idx].extra_test = []
+            for extra_test_list in save_detail[extra_test_key]:
+                if type(extra_test_list) is list and len(extra_test_list)>=1:
+                    benchmark[idx].extra_test += [Test(**i) for i in extra_test_list]
+                    tmp += 1
+                elif type(extra_test_list) is dict and "input" in extra_test_list.keys():
+                    benchmark[idx].extra_test += [Test(**i) for i in save_detail[extra_test_key]]
+                    tmp += 1
+                    break
+            benchmark[idx].extra_test = [t for t in benchmark[idx].extra_test if check_testtype(t.testtype, benchmark[idx].platform)]
     assert tmp == num, tmp
     return check_metadata_list, benchmark
\ No newline at end of file
@@ -0,0 +1,118 @@
+import json
+
+STREAM_STOP_CONDITIONS = ("code_block", "json")
+PYTHON_FENCE_TAGS = ("python", "python3", "py")
+
+
+class StreamStop:
+    """Decides, from a streamed completion so far, that the rest is not needed.
+
+    `feed` takes each text delta and returns True once the condition is met:
+      - "code_block": a ```python block has been closed and the response
+        has moved on to text that does not lead into another block. Fences
+        without a python tag (sample I/O) never stop the stream, and neither
+        does a block followed by a fence or a line ending in ":", since
+        `extract_code` reads the last block.
+      - "json": a JSON array or object starting on its own line has been
+        closed (and the fence around it, if any).
+    Text is scanned one complete line at a time, and everything inside a
+    reasoning model's <think> block is ignored.
+    """
+
+    def __init__(self, condition: str):
+        if condition not in STREAM_STOP_CONDITIONS:
+            raise ValueError(f"unknown stream stop condition {condition!r}")
+        self.condition = condition
+        self._partial_line = ""
+        self._in_think = False
+        self._fence_open = False
+        self._python_fence = False
+        self._python_block_closed = False
+        self._json_lines = None
+        self._json_indent = 0
+        self._json_closed = False
+
+    def feed(self, delta: str) -> bool:
+        *lines, self._partial_line = (self._partial_line + delta).split("\n")
+        return any(self._line_completes(line) for line in lines)
+
+    def _line_completes(self, line: str) -> bool:
+        if "<think>" in line:
+            self._in_think = True
+        if "</think>" in line:
+            self._in_think = False
+            line = line.split("</think>")[-1]
+        if self._in_think:
+            return False
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            self._fence_open = not self._fence_open
+            if self._fence_open:
+                self._python_fence = stripped[3:].strip().lower() in PYTHON_FENCE_TAGS
+                self._python_block_closed = False
+                self._json_lines = None
+                return False
+            self._python_block_closed = self._python_fence
+            return self.condition == "json" and self._json_closed
+        if self.condition == "json":
+            return self._json_line(line, stripped)
+        if self._fence_open or not self._python_block_closed or not stripped:
+            return False
+        if stripped.endswith(":"):
+            # "Here is a faster version:" announces another block
+            self._python_block_closed = False
+            return False
+        return True
+
+    def _json_line(self, line: str, stripped: str) -> bool:
+        if self._json_closed:
+            return False
+        indent = len(line) - len(line.lstrip())
+        if self._json_lines is None:
+            if not stripped.startswith(("[", "{")):
+                return False
+            self._json_lines = []
+            self._json_indent = indent
+        self._json_lines.append(line)
+        # a value can only close on a line at or left of its opening bracket
+        if indent > self._json_indent or not stripped.endswith(("]", "}")):
+            return False
+        try:
+            json.loads("\n".join(self._json_lines))
+        except json.JSONDecodeError:
+            # not JSON after all; the line may still open a value itself
+            retry = len(self._json_lines) > 1
+            self._json_lines = None
+            return retry and self._json_line(line, stripped)
+        self._json_closed = True
+        return not self._fence_open
+
+
+class StreamStats:
+    """Counts streamed completions by how they ended, and their tokens.
+
+    Every content delta of the stream counts as one token, which is how
+    vLLM and SGLang send them. A stopped request could have run on for up
+    to `max_tokens`; the unused part of that budget is reported as the
+    upper bound of the tokens saved.
+    """
+
+    def __init__(self, max_tokens: int | None):
+        self.max_tokens = max_tokens
+        self.counts = {"finished": 0, "stopped": 0, "timeout": 0}
+        self.tokens = 0
+        self.max_tokens_saved = 0
+
+    def record(self, reason: str, tokens: int):
+        self.counts[reason] += 1
+        self.tokens += tokens
+        if reason == "stopped" and self.max_tokens:
+            self.max_tokens_saved += max(self.max_tokens - tokens, 0)
+
+    def summary(self) -> str:
+        total = sum(self.counts.values())
+        return (
+            f"streamed {total} completions ({self.counts['stopped']} stopped early, "
+            f"{self.counts['timeout']} timed out), {self.tokens} tokens generated, "
+            f"up to {self.max_tokens_saved} tokens saved by stopping early"
+        )
@@ -22,7 +22,7 @@ class VLLMRunner(BaseRunner):
             max_model_len=self.args.max_tokens,
             # enforce_eager=True,
             disable_custom_all_reduce=True,
-            # enable_prefix_caching=args.enable_prefix_caching,
+            enable_prefix_caching=args.enable_prefix_caching,
             trust_remote_code=args.trust_remote_code,
         )
         self.sampling_params = SamplingParams(
@@ -39,26 +39,30 @@ class VLLMRunner(BaseRunner):
         pass
 
     def run_batch(self, prompts: list[str]) -> list[list[str]]:
-        outputs = [None for _ in prompts]
-        remaining_prompts = []
-        remaining_indices = []
-        for prompt_index, prompt in enumerate(prompts):
-            if self.args.use_cache and prompt in self.cache:
-                if len(self.cache[prompt]) == self.args.n:
-                    outputs[prompt_index] = self.cache[prompt]
-                    continue
-            remaining_prompts.append(prompt)
-            remaining_indices.append(prompt_index)
-        if remaining_prompts:
-            vllm_outputs = self.llm.generate(remaining_prompts, self.sampling_params)
-            if self.args.use_cache:
-                assert len(remaining_prompts) == len(vllm_outputs)
-                for index, remaining_prompt, vllm_output in zip(
-                    remaining_indices, remaining_prompts, vllm_outputs
-                ):
-                    self.cache[remaining_prompt] = [o.text for o in vllm_output.outputs]
-                    outputs[index] = [o.text for o in vllm_output.outputs]
-            else:
-                for index, vllm_output in zip(remaining_indices, vllm_outputs):
-                    outputs[index] = [o.text for o in vllm_output.outputs]
+        outputs, pending = self.lookup_cache(prompts)
+        if pending:
+            vllm_outputs = self.llm.generate(
+                [prompt for prompt, _ in pending], self.sampling_params
+            )
+            assert len(pending) == len(vllm_outputs)
+            results = [[o.text for o in vllm_output.outputs] for vllm_output in vllm_outputs]
+            self.store_outputs(outputs, pending, results)
+            if self.args.enable_prefix_caching:
+                self.report_prefix_cache_hits(vllm_outputs)
         return outputs
+
+    @staticmethod
+    def report_prefix_cache_hits(vllm_outputs):
+        """Print the share of prompt tokens served from the prefix cache."""
+        cached_tokens = prompt_tokens = 0
+        for vllm_output in vllm_outputs:
+            num_cached_tokens = getattr(vllm_output, "num_cached_tokens", None)
+            if num_cached_tokens is None or not vllm_output.prompt_token_ids:
+                continue  # older vllm versions do not report it
+            cached_tokens += num_cached_tokens
+            prompt_tokens += len(vllm_output.prompt_token_ids)
+        if prompt_tokens:
+            print(
+                f"prefix cache hit rate {cached_tokens / prompt_tokens:.1%} "
+                f"({cached_tokens}/{prompt_tokens} prompt tokens)"
+            )
@@ -0,0 +1,32 @@
+from collections import defaultdict
+
+
+def record_question_id(record):
+    if isinstance(record, dict):
+        return record["question_id"]
+    return record.question_id
+
+
+class RecordStore:
+    """Records (result dicts or benchmark problems) indexed by question_id.
+
+    Replaces `for record in records: if record["question_id"] == ...` scans,
+    so joining two lists is O(N) instead of O(N^2). `matches` returns every
+    record with the id in list order, which keeps the behaviour of those scans
+    when an id occurs more than once.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self._index = defaultdict(list)
+        for record in records:
+            self._index[record_question_id(record)].append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, question_id):
+        return question_id in self._index
+
+    def matches(self, question_id) -> list:
+        return self._index.get(question_id, [])
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""Time the per-evaluation setup of a candidate in a long-lived sandbox
+worker: executing the `import_string` prelude plus a fresh compile of the
+candidate (the old `compile_code`) against the cached code object and prelude
+namespace used by `compile_code` now.
+
+Sandbox jobs run in a child forked from the worker, so the last two columns
+time a whole forked job setup: with the cache filled in the child only (lost
+with it) and with the cache filled in the worker before forking."""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from types import ModuleType
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from lcb_runner.evaluation import testing_util
+from lcb_runner.evaluation.testing_util import (
+    clean_if_name,
+    compile_code,
+    compile_program,
+    import_string,
+    make_function,
+)
+
+STDIO_CANDIDATE = """
+import sys
+from collections import deque
+
+def solve():
+    n, m = map(int, sys.stdin.readline().split())
+    graph = [[] for _ in range(n)]
+    for _ in range(m):
+        u, v = map(int, sys.stdin.readline().split())
+        graph[u - 1].append(v - 1)
+        graph[v - 1].append(u - 1)
+    dist = [-1] * n
+    dist[0] = 0
+    queue = deque([0])
+    while queue:
+        node = queue.popleft()
+        for nxt in graph[node]:
+            if dist[nxt] < 0:
+                dist[nxt] = dist[node] + 1
+                queue.append(nxt)
+    print(*dist)
+
+if __name__ == '__main__':
+    solve()
+"""
+
+CALL_BASED_CANDIDATE = """
+class Solution:
+    def maximumSubarraySum(self, nums: List[int], k: int) -> int:
+        prefix = {}
+        total = 0
+        best = -inf
+        for num in nums:
+            if num - k in prefix:
+                best = max(best, total + num - prefix[num - k])
+            if num + k in prefix:
+                best = max(best, total + num - prefix[num + k])
+            if num not in prefix or prefix[num] > total:
+                prefix[num] = total
+            total += num
+        return 0 if best == -inf else best
+"""
+
+
+def legacy_compile_code(code):
+    tmp_sol = ModuleType("tmp_sol", "")
+    exec(code, tmp_sol.__dict__)
+    if "class Solution" in code:
+        return tmp_sol.Solution()
+    return tmp_sol
+
+
+def timed(func, code, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(code)
+    return (time.perf_counter() - start) / repeats
+
+
+def forked(func, code):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            func(code)
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+
+def forked_cold(code):
+    testing_util._compiled_programs.clear()
+    forked(lambda code: compile_code(code, 6), code)
+
+
+def forked_warm(code):
+    compile_program(code)
+    forked(lambda code: compile_code(code, 6), code)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    candidates = {
+        "stdio": make_function(clean_if_name(STDIO_CANDIDATE)),
+        "call-based": import_string + "\n\n" + CALL_BASED_CANDIDATE,
+    }
+    print(
+        f"{'candidate':<12} {'legacy_ms':>10} {'cached_ms':>10} {'speedup':>8} "
+        f"{'fork_cold_ms':>13} {'fork_warm_ms':>13}"
+    )
+    for name, code in candidates.items():
+        legacy_seconds = timed(legacy_compile_code, code, args.repeats)
+        compile_code(code, 6)  # first evaluation in a worker compiles
+        cached_seconds = timed(lambda code: compile_code(code, 6), code, args.repeats)
+        cold_seconds = timed(forked_cold, code, args.repeats)
+        warm_seconds = timed(forked_warm, code, args.repeats)
+        print(
+            f"{name:<12} {legacy_seconds * 1000:>10.3f} {cached_seconds * 1000:>10.3f} "
+            f"{legacy_seconds / cached_seconds:>7.1f}x "
+            f"{cold_seconds * 1000:>13.3f} {warm_seconds * 1000:>13.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Time the question_id join used by main.py, run_main_repair and
+scenario_router on synthetic records: the old nested-loop scan against
+RecordStore. The nested scan is skipped above --max-nested records."""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from lcb_runner.utils.record_store import RecordStore
+
+
+def make_records(num_records, seed):
+    question_ids = [f"q{idx:07d}" for idx in range(num_records)]
+    records = [
+        {"question_id": question_id, "code_list": [f"print({idx})"]}
+        for idx, question_id in enumerate(question_ids)
+    ]
+    problems = list(question_ids)
+    random.Random(seed).shuffle(problems)
+    return problems, records
+
+
+def nested_join(problems, records):
+    matched = 0
+    for question_id in problems:
+        for record in records:
+            if question_id == record["question_id"]:
+                matched += 1
+    return matched
+
+
+def store_join(problems, records):
+    store = RecordStore(records)
+    matched = 0
+    for question_id in problems:
+        matched += len(store.matches(question_id))
+    return matched
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--max-nested", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'nested_s':>12} {'store_s':>10} {'speedup':>10}")
+    for size in args.sizes:
+        problems, records = make_records(size, args.seed)
+        matched, store_seconds = timed(store_join, problems, records)
+        assert matched == size, matched
+        if size <= args.max_nested:
+            nested_matched, nested_seconds = timed(nested_join, problems, records)
+            assert nested_matched == matched
+            print(f"{size:>10} {nested_seconds:>12.3f} {store_seconds:>10.3f} {nested_seconds / store_seconds:>9.0f}x")
+        else:
+            print(f"{size:>10} {'skipped':>12} {store_seconds:>10.3f} {'-':>10}")
+
+
+if __name__ == "__main__":
+    main()
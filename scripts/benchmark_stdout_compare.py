@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Time the stdout comparison of grade_stdio on large synthetic outputs: the
+old per-line Decimal comparison against the tiered `stdio_lines_match` (plus
+the whole-output exact match in grade_stdio). Every case is also checked for
+an identical verdict."""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from lcb_runner.evaluation.testing_util import (
+    convert_line_to_decimals,
+    decimal_lines_close,
+    get_stripped_lines,
+    line_has_decimal_token,
+    stdio_lines_match,
+)
+
+
+def legacy_compare(prediction, expected):
+    prediction_lines = get_stripped_lines(prediction)
+    expected_lines = get_stripped_lines(expected)
+    if len(prediction_lines) != len(expected_lines):
+        return "length"
+    for line_idx, (prediction_line, expected_line) in enumerate(
+        zip(prediction_lines, expected_lines)
+    ):
+        if prediction_line == expected_line:
+            continue
+        success, decimal_prediction = convert_line_to_decimals(prediction_line)
+        if not success:
+            return line_idx
+        success, decimal_expected = convert_line_to_decimals(expected_line)
+        if not success:
+            return line_idx
+        if decimal_prediction == decimal_expected:
+            continue
+        if (
+            line_has_decimal_token(prediction_line)
+            or line_has_decimal_token(expected_line)
+        ) and decimal_lines_close(decimal_prediction, decimal_expected):
+            continue
+        return line_idx
+    return True
+
+
+def tiered_compare(prediction, expected):
+    if prediction.strip() == expected.strip():
+        return True
+    prediction_lines = get_stripped_lines(prediction)
+    expected_lines = get_stripped_lines(expected)
+    if len(prediction_lines) != len(expected_lines):
+        return "length"
+    for line_idx, (prediction_line, expected_line) in enumerate(
+        zip(prediction_lines, expected_lines)
+    ):
+        if prediction_line == expected_line:
+            continue
+        if stdio_lines_match(prediction_line, expected_line):
+            continue
+        return line_idx
+    return True
+
+
+def make_cases(size, rng):
+    numbers = [rng.randint(-(10**12), 10**12) for _ in range(size)]
+    floats = [rng.uniform(-1000, 1000) for _ in range(size)]
+    one_line = " ".join(map(str, numbers))
+    many_lines = "\n".join(map(str, numbers))
+    float_line = " ".join(f"{value:.9f}" for value in floats)
+    wrong = list(numbers)
+    wrong[size // 2] += 1
+    return {
+        "exact one line": (one_line + "\n", one_line),
+        "exact many lines": (many_lines + "\n", many_lines),
+        "extra spaces": ("  ".join(map(str, numbers)), one_line),
+        "leading zeros": (" ".join(f"0{value}" if value > 0 else str(value) for value in numbers), one_line),
+        "floats within tolerance": (" ".join(f"{value:.7f}" for value in floats), float_line),
+        "wrong answer": (" ".join(map(str, wrong)), one_line),
+        "wrong line": ("\n".join(map(str, wrong)), many_lines),
+        "not a number": (one_line.replace(str(numbers[-1]), "x"), one_line + " "),
+    }
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'tokens':>8} {'case':<24} {'verdict':>8} {'legacy_s':>10} {'tiered_s':>10} {'speedup':>8}")
+    for size in args.sizes:
+        for name, (prediction, expected) in make_cases(size, rng).items():
+            legacy_verdict, legacy_seconds = timed(legacy_compare, prediction, expected)
+            tiered_verdict, tiered_seconds = timed(tiered_compare, prediction, expected)
+            assert legacy_verdict == tiered_verdict, (name, legacy_verdict, tiered_verdict)
+            print(
+                f"{size:>8} {name:<24} {str(legacy_verdict):>8} {legacy_seconds:>10.4f} "
+                f"{tiered_seconds:>10.4f} {legacy_seconds / tiered_seconds:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
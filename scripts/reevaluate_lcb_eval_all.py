@@ -13,6 +13,8 @@ from lcb_runner.evaluation.compute_code_generation_metrics import codegen_metric
 from lcb_runner.evaluation.pass_k_utils import extract_instance_results
 from lcb_runner.evaluation.pass_k_utils import compute_metrics_from_results
 from lcb_runner.evaluation.testing_util import run_test
+from lcb_runner.evaluation.result_cache import open_eval_cache
+from lcb_runner.runner.scenario_router import get_run_options
 
 
 def parse_indices(text: str, size: int) -> list[int]:
@@ -53,7 +55,17 @@ def main() -> None:
     parser.add_argument("--eval-out", default="")
     parser.add_argument("--timeout", type=int, default=6)
     parser.add_argument("--num-process", type=int, default=12)
+    parser.add_argument("--eval-cache", default="cache/eval_results.sqlite")
+    parser.add_argument("--eval-cache-max-mb", type=int, default=2048)
+    parser.add_argument("--no-eval-cache", action="store_true")
+    parser.add_argument("--stdio-engine", choices=["patch", "fork"], default="patch")
+    parser.add_argument("--cpu-timeout", type=float, default=None)
+    parser.add_argument("--memory-limit-mb", type=int, default=0)
     args = parser.parse_args()
+    run_options = get_run_options(args)
+    eval_cache = None
+    if not args.no_eval_cache:
+        eval_cache = open_eval_cache(args.eval_cache, args.eval_cache_max_mb * 1024 * 1024)
 
     source_path = Path(args.eval_all)
     data = json.loads(source_path.read_text())
@@ -68,6 +80,8 @@ def main() -> None:
             raise SystemExit(f"question_id not found in benchmark: {question_id}")
         selected_benchmark.append(problem_by_question_id[question_id])
     samples = [problem.get_evaluation_sample() for problem in selected_benchmark]
+    for problem in selected_benchmark:
+        problem.release_private_tests()
     generations = [[(data[i].get("code_list") or [""])[0]] for i in selected_indices]
 
     if args.num_process <= 1:
@@ -78,7 +92,15 @@ def main() -> None:
             results[idx] = []
             metadata[idx] = []
             for generation in generation_list:
-                curr_res, curr_metadata = run_test(sample, test=generation, debug=False, timeout=args.timeout)
+                cached = eval_cache.get(sample, generation, args.timeout, run_options) if eval_cache else None
+                if cached is not None:
+                    curr_res, curr_metadata = cached
+                else:
+                    curr_res, curr_metadata = run_test(
+                        sample, test=generation, debug=False, timeout=args.timeout, **run_options
+                    )
+                    if eval_cache is not None:
+                        eval_cache.put(sample, generation, args.timeout, (curr_res, curr_metadata), run_options)
                 results[idx].append(curr_res)
                 metadata[idx].append(curr_metadata)
             final_metadata.append([json.dumps(item) for item in metadata[idx]])
@@ -90,6 +112,8 @@ def main() -> None:
             num_process_evaluate=args.num_process,
             timeout=args.timeout,
             debug=False,
+            eval_cache=eval_cache,
+            run_options=run_options,
         )
     graded = extract_instance_results(metrics[1])
     metadatas = metrics[2]
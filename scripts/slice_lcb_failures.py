@@ -53,6 +53,8 @@ def error_bucket(metadata):
         return "wrong_answer"
     if code == -4:
         return "runtime_error"
+    if code == -6:
+        return "memory_limit"
     return f"error_{code}"
 
 
@@ -0,0 +1,39 @@
+import pytest
+
+from lcb_runner.runner.concurrency_limiter import rejects_parameter
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, message, body=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        StatusError(400, "Error code: 400 - n must be 1 when using greedy sampling"),
+        StatusError(400, "Error code: 400 - {'message': 'best_of must be greater than or equal to `n`'}"),
+        StatusError(422, "Unprocessable Entity", body={"detail": [{"loc": ["body", "n"]}]}),
+    ],
+)
+def test_rejects_n(error):
+    assert rejects_parameter(error, "n")
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        StatusError(
+            400,
+            "Error code: 400 - This model's maximum context length is 4096 tokens. "
+            "However, you requested 5000 tokens in the messages.",
+        ),
+        StatusError(400, "Error code: 400 - invalid prompt 'line\\n'"),
+        StatusError(500, "n must be 1"),
+        ValueError("n must be 1"),
+    ],
+)
+def test_other_errors_do_not_reject_n(error):
+    assert not rejects_parameter(error, "n")
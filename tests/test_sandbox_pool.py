@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from lcb_runner.evaluation import testing_util
+from lcb_runner.evaluation.sandbox_pool import SandboxPool
+from lcb_runner.evaluation.testing_util import run_test, warm_caches
+
+SAMPLE = {"input_output": json.dumps({"inputs": ["12 18\n"], "outputs": ["6\n"]})}
+
+MUTATING = """
+import gc, math, signal, sys
+gc.disable()
+math.gcd = lambda a, b: -1
+signal.signal(signal.SIGALRM, signal.SIG_IGN)
+sys.setrecursionlimit(100)
+a, b = map(int, input().split())
+print(6)
+"""
+
+CLEAN = """
+import gc, math, sys
+a, b = map(int, input().split())
+assert gc.isenabled() and sys.getrecursionlimit() > 100
+print(math.gcd(a, b))
+"""
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(1)
+    yield pool
+    pool.close()
+
+
+@pytest.mark.parametrize("stdio_engine", ["patch", "fork"])
+def test_state_does_not_leak_between_jobs(pool, stdio_engine):
+    options = {"stdio_engine": stdio_engine}
+    assert pool.run(SAMPLE, MUTATING, timeout=6, run_options=options)[0] == [True]
+    assert pool.run(SAMPLE, CLEAN, timeout=6, run_options=options)[0] == [True]
+
+
+def test_exiting_candidate_keeps_worker(pool):
+    result, metadata = pool.run(SAMPLE, "import os\nos._exit(3)\n", timeout=6)
+    assert result == [-1] and metadata["error_code"] == -4
+    assert pool.run(SAMPLE, CLEAN, timeout=6)[0] == [True]
+
+
+@pytest.mark.parametrize("stdio_engine", ["patch", "fork"])
+def test_warm_caches_compiles_candidate(stdio_engine):
+    testing_util._compiled_programs.clear()
+    warm_caches(SAMPLE, CLEAN, stdio_engine)
+    assert len(testing_util._compiled_programs) == 1
+    assert run_test(SAMPLE, CLEAN, stdio_engine=stdio_engine)[0] == [True]
+    assert len(testing_util._compiled_programs) == 1
@@ -0,0 +1,73 @@
+import pytest
+
+from lcb_runner.runner.stream_stop import StreamStop
+
+
+def stream(condition, text, step=3):
+    """Feed `text` in `step`-sized deltas; return the text sent before the stop, or None."""
+    stop = StreamStop(condition)
+    sent = ""
+    for i in range(0, len(text), step):
+        sent += text[i : i + step]
+        if stop.feed(text[i : i + step]):
+            return sent
+    return None
+
+
+def test_code_block_stops_after_python_block():
+    text = "Solution:\n```python\nprint(1)\n```\nThis runs in O(n).\nMore words\n"
+    assert stream("code_block", text, step=1) == (
+        "Solution:\n```python\nprint(1)\n```\nThis runs in O(n).\n"
+    )
+
+
+def test_code_block_ignores_unlabeled_fences():
+    text = (
+        "For sample input\n```\n3\n1 2 3\n```\nthe answer is 6.\n"
+        "```python\nprint(sum(map(int, input().split())))\n```\nDone.\n"
+    )
+    assert stream("code_block", text + "Cut here\n", step=1) == text
+
+
+def test_code_block_keeps_streaming_into_next_block():
+    text = (
+        "```python\nslow()\n```\nHere is a faster version:\n\n"
+        "```py\nfast()\n```\n\n```python\nfastest()\n```\nThat is all.\n"
+    )
+    assert stream("code_block", text + "Cut here\n", step=1) == text
+
+
+def test_code_block_without_text_after_block_runs_to_the_end():
+    assert stream("code_block", "```python\nprint(1)\n```\n") is None
+    assert stream("code_block", "```\nplain\n```\nnot python\n") is None
+
+
+def test_code_block_ignores_think():
+    text = "<think>\n```python\nx = 1\n```\nhmm\n</think>\n```python\ny = 2\n```\nend\n"
+    assert stream("code_block", text + "Cut here\n", step=1) == text
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("We use nums[i] here.\n[\n  {\"a\": [1,\n 2]},\n  {\"b\": 2}\n]\nblah\n", "  {\"b\": 2}\n]\n"),
+        ("```json\n[1, 2]\n```\nafter\n", "[1, 2]\n```\n"),
+        ("{\"properties\": [\n]}\nafter\n", "]}\n"),
+        ("[bad]\n[1]\nx\n", "[1]\n"),
+    ],
+)
+def test_json_stops_after_closed_value(text, expected):
+    sent = stream("json", text, step=1)
+    assert sent is not None
+    assert sent.endswith(expected)
+
+
+def test_json_waits_for_fence_and_ignores_prose_brackets():
+    assert stream("json", "Note nums[i] and {x}\nstill prose\n") is None
+    sent = stream("json", "```json\n[\n  1\n]\n", step=1)
+    assert sent is None
+
+
+def test_unknown_condition():
+    with pytest.raises(ValueError):
+        StreamStop("eos")